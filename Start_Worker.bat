@@ -0,0 +1,2 @@
+call "sharkninjadev\Scripts\activate"
+python worker.py
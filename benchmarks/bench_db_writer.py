@@ -0,0 +1,91 @@
+"""Rows/sec of db_writer.save_products against the old per-row save_to_db loop.
+
+    python -m benchmarks.bench_db_writer --products 10000 --runs 3
+
+Each run writes one status row per product into a fresh temporary database;
+later runs see existing Countries/Brands/Products/URLs like a daily sweep does.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from db_writer import save_products
+from schema import migrate
+
+MARKETS = [("NL", "Shark", "sharkclean.nl"), ("NL", "Ninja", "ninjakitchen.nl"),
+           ("BE", "Shark", "sharkclean.be"), ("BE", "Ninja", "ninjakitchen.be"),
+           ("FR", "Shark", "sharkclean.fr"), ("FR", "Ninja", "ninjakitchen.fr")]
+
+
+def make_rows(count, run):
+    date = (datetime(2024, 8, 28) + timedelta(days=run)).strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for i in range(count):
+        country, brand, host = MARKETS[i % len(MARKETS)]
+        sku = f"SKU{i:06d}"
+        status = "OUT" if (i + run) % 7 == 0 else "IN"
+        rows.append((sku, f"{brand} product {i}", date, f"https://{host}/product/item-{i}-zid{sku}",
+                     status, brand, f"€ {100 + i % 50},99", country, brand))
+    return rows
+
+
+def legacy_save(rows, db_name):
+    # The per-row statements the scrapers used before db_writer
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    for sku, name, date, url, status, product_type, price, country, brand in rows:
+        cursor.execute("INSERT OR IGNORE INTO Countries (CountryCode) VALUES (?)", (country,))
+        cursor.execute("SELECT CountryID FROM Countries WHERE CountryCode = ?", (country,))
+        country_id = cursor.fetchone()[0]
+        cursor.execute("INSERT OR IGNORE INTO Brands (BrandName) VALUES (?)", (brand,))
+        cursor.execute("SELECT BrandID FROM Brands WHERE BrandName = ?", (brand,))
+        brand_id = cursor.fetchone()[0]
+        cursor.execute("INSERT OR IGNORE INTO Products (SKU, ProductName) VALUES (?, ?)", (sku, name))
+        cursor.execute("SELECT ProductID FROM Products WHERE SKU = ?", (sku,))
+        product_id = cursor.fetchone()[0]
+        cursor.execute("INSERT OR IGNORE INTO URLs (URL) VALUES (?)", (url,))
+        cursor.execute("SELECT rowid FROM URLs WHERE URL = ?", (url,))
+        url_id = cursor.fetchone()[0]
+        cursor.execute("INSERT OR IGNORE INTO SKU_URL (SKUID, URLID) VALUES (?, ?)", (product_id, url_id))
+        cursor.execute("""
+        INSERT OR REPLACE INTO ProductStatus
+        (ProductID, CountryID, BrandID, Date, Status, Type, CurrentPrice)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (product_id, country_id, brand_id, date, status, product_type, price))
+    conn.commit()
+    conn.close()
+
+
+def bench(writer, products, runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        migrate(db_name)
+
+        timings = []
+        for run in range(runs):
+            rows = make_rows(products, run)
+            start = time.perf_counter()
+            writer(rows, db_name)
+            timings.append(time.perf_counter() - start)
+
+        conn = sqlite3.connect(db_name)
+        written = conn.execute("SELECT COUNT(*) FROM ProductStatus").fetchone()[0]
+        conn.close()
+    # The per-row loop stores every row, save_products only status and price changes
+    assert products <= written <= products * runs, written
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for label, writer in [("per-row", legacy_save), ("bulk", save_products)]:
+        timings = bench(writer, args.products, args.runs)
+        rates = ", ".join(f"{args.products / t:,.0f}" for t in timings)
+        print(f"{label:<8} rows/sec per run: {rates}")
@@ -0,0 +1,140 @@
+"""Out-of-stock history: the old self-join query, the episode pass over the log and the StockEpisodes table.
+
+    python -m benchmarks.bench_episodes --products 200 --years 3 --checks-per-day 4
+
+Builds a synthetic multi-year ProductStatus history in a temporary database,
+sweep by sweep with episodes.update_episodes like db_writer.save_products does,
+times the three ways of getting the OUT -> IN episodes for one country/brand and
+checks that they return the same rows.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from episodes import episodes_from_log, update_episodes
+from queries import OUT_OF_STOCK_HISTORY
+from schema import migrate
+
+# The query get_out_of_stock_history ran before episodes.py; every OUT row is
+# joined with all later IN rows of the same SKU, so it grows quadratically
+LEGACY_OUT_OF_STOCK_HISTORY = """
+    WITH status_changes AS (
+        SELECT 
+            p.SKU, 
+            datetime(ps.Date) AS DateTime,
+            ps.Status,
+            LAG(ps.Status) OVER (PARTITION BY p.SKU ORDER BY datetime(ps.Date)) AS prev_status
+        FROM Products p
+        JOIN ProductStatus ps ON p.ProductID = ps.ProductID
+        JOIN Countries c ON ps.CountryID = c.CountryID
+        JOIN Brands b ON ps.BrandID = b.BrandID
+        WHERE c.CountryCode = ? AND b.BrandName = ?
+    ),
+    out_of_stock_periods AS (
+        SELECT 
+            a.SKU, 
+            a.DateTime AS OutOfStockDate,
+            MIN(b.DateTime) AS BackInStockDate
+        FROM status_changes a
+        LEFT JOIN status_changes b ON a.SKU = b.SKU 
+            AND b.DateTime > a.DateTime 
+            AND b.Status = 'IN'
+        WHERE a.Status = 'OUT' AND (a.prev_status IS NULL OR a.prev_status = 'IN')
+        GROUP BY a.SKU, a.DateTime
+    )
+    SELECT 
+        SKU, 
+        OutOfStockDate,
+        BackInStockDate,
+        CASE 
+            WHEN BackInStockDate IS NOT NULL THEN 
+                MAX(1, CAST((JULIANDAY(BackInStockDate) - JULIANDAY(OutOfStockDate)) AS INTEGER))
+            ELSE 
+                CAST((JULIANDAY('now') - JULIANDAY(OutOfStockDate)) AS INTEGER)
+        END AS DaysOutOfStock
+    FROM out_of_stock_periods
+    ORDER BY SKU, OutOfStockDate DESC
+    """
+
+MARKETS = [("NL", "Shark"), ("BE", "Shark")]
+GO_OUT = 0.02       # chance that an in-stock product is out of stock at the next check
+COME_BACK = 0.1     # chance that an out-of-stock product is back at the next check
+
+
+def make_history(db_name, products, years, checks_per_day, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1) - timedelta(days=365 * years)
+    checks = 365 * years * checks_per_day
+    step = timedelta(days=1) / checks_per_day
+
+    conn = sqlite3.connect(db_name)
+    conn.executemany("INSERT INTO Countries (CountryID, CountryCode) VALUES (?, ?)",
+                     [(i + 1, country) for i, (country, _) in enumerate(MARKETS)])
+    conn.execute("INSERT INTO Brands (BrandID, BrandName) VALUES (1, 'Shark')")
+    conn.executemany("INSERT INTO Products (ProductID, SKU, ProductName) VALUES (?, ?, ?)",
+                     [(i + 1, f"SKU{i:06d}", f"Shark product {i}") for i in range(products)])
+    statuses = {(product_id, country_id): "IN"
+                for product_id in range(1, products + 1) for country_id in range(1, len(MARKETS) + 1)}
+    for check in range(checks):
+        rows = []
+        for (product_id, country_id), status in statuses.items():
+            if rng.random() < (COME_BACK if status == "OUT" else GO_OUT):
+                status = statuses[product_id, country_id] = "IN" if status == "OUT" else "OUT"
+            date = start + check * step + timedelta(seconds=rng.randrange(600))
+            rows.append((product_id, country_id, 1, date.strftime("%Y-%m-%d %H:%M:%S"), status))
+        conn.executemany("""
+            INSERT INTO ProductStatus (ProductID, CountryID, BrandID, Date, Status)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+        update_episodes(conn, rows)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return products * len(MARKETS) * checks
+
+
+def read_history(query, country, brand, db_name):
+    conn = sqlite3.connect(db_name)
+    try:
+        return pd.read_sql_query(query, conn, params=(country, brand))
+    finally:
+        conn.close()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--checks-per-day", type=int, default=4)
+    parser.add_argument("--skip-legacy", action="store_true", help="skip the slow self-join query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        migrate(db_name)
+        rows = make_history(db_name, args.products, args.years, args.checks_per_day)
+        print(f"{rows:,} status rows, {rows // args.products // len(MARKETS):,} per product and country")
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        table, table_time = timed(read_history, OUT_OF_STOCK_HISTORY, "NL", "Shark", db_name)
+        print(f"table     {table_time:8.2f}s  {len(table):,} episodes")
+        log, log_time = timed(episodes_from_log, "NL", "Shark", db_name, now)
+        print(f"log pass  {log_time:8.2f}s  {len(log):,} episodes")
+        pd.testing.assert_frame_equal(table, log, check_dtype=False)
+        if not args.skip_legacy:
+            old, old_time = timed(read_history, LEGACY_OUT_OF_STOCK_HISTORY, "NL", "Shark", db_name)
+            print(f"self-join {old_time:8.2f}s  {len(old):,} episodes  ({old_time / table_time:.0f}x slower than the table)")
+            pd.testing.assert_frame_equal(table, old, check_dtype=False)
+        print("Results are identical")
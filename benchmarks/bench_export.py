@@ -0,0 +1,128 @@
+"""Time and peak memory of the price export: in-memory workbook against the streaming exports.
+
+    python -m benchmarks.bench_export --rows 1000000 [--snapshot] [--skip-legacy]
+
+Fills a temporary database with synthetic Prices rows and runs every export in
+its own process, so each peak RSS is measured from a fresh interpreter:
+- legacy: the whole join in one DataFrame, written with openpyxl to a BytesIO
+  (PriceManager.export_data before exports.py)
+- xlsx: exports.export_prices, xlsxwriter in constant_memory mode
+- csv: exports.export_prices, gzip-compressed CSV
+With --snapshot the streaming exports read complete months from a Parquet
+snapshot instead of SQLite.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from db import close_all
+from schema import migrate
+
+COUNTRIES = ["NL", "BE", "FR"]
+LEGACY_QUERY = """
+    SELECT pr.SKU, p.Price, p.EntryDate, p.Reason, c.CountryCode as Country
+    FROM Prices p
+    JOIN Products pr ON p.ProductID = pr.ProductID
+    JOIN Countries c ON p.CountryID = c.CountryID
+"""
+
+
+def make_prices(db_name, rows, products=2000):
+    migrate(db_name)
+    entries = rows // (products * len(COUNTRIES)) + 1
+    start = datetime(2026, 9, 1) - timedelta(days=entries)
+    conn = sqlite3.connect(db_name)
+    conn.executemany("INSERT INTO Countries (CountryID, CountryCode) VALUES (?, ?)",
+                     [(i + 1, country) for i, country in enumerate(COUNTRIES)])
+    conn.executemany("INSERT INTO Products (ProductID, SKU, ProductName) VALUES (?, ?, ?)",
+                     [(i + 1, f"SKU{i:06d}", f"Product {i}") for i in range(products)])
+
+    def generate():
+        written = 0
+        for day in range(entries):
+            date = (start + timedelta(days=day)).strftime("%Y-%m-%d %H:%M:%S")
+            for product_id in range(1, products + 1):
+                for country_id in range(1, len(COUNTRIES) + 1):
+                    if written == rows:
+                        return
+                    written += 1
+                    yield (product_id, country_id, 100 + (product_id * 7 + day) % 50 + 0.99, date,
+                           "Newly scraped price")
+
+    conn.executemany("INSERT INTO Prices (ProductID, CountryID, Price, EntryDate, Reason) VALUES (?, ?, ?, ?, ?)",
+                     generate())
+    conn.commit()
+    # Measure reads from the database file, not from a freshly written WAL
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def run_legacy(db_name):
+    conn = sqlite3.connect(db_name)
+    df = pd.read_sql_query(LEGACY_QUERY, conn)
+    conn.close()
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="Prices")
+    return len(output.getvalue())
+
+
+def run_streaming(db_name, fmt):
+    from exports import export_prices
+
+    path = export_prices(fmt, db_name)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+def child(method, db_name):
+    start = time.perf_counter()
+    size = run_legacy(db_name) if method == "legacy" else run_streaming(db_name, method)
+    print(json.dumps({
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "size_mb": size / 1e6,
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--snapshot", action="store_true", help="export a Parquet snapshot first")
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--child", nargs=2, metavar=("METHOD", "DB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        make_prices(db_name, args.rows)
+        print(f"{args.rows:,} price rows")
+        if args.snapshot:
+            from snapshots import export_table
+
+            manifest = export_table("prices", db_name)
+            print(f"Snapshot: {manifest['rows']:,} rows in {manifest['seconds']}s")
+            close_all()
+
+        methods = ["xlsx", "csv"] + ([] if args.skip_legacy else ["legacy"])
+        for method in methods:
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_export", "--child", method, db_name],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{method:<7} {result['seconds']:7.1f}s  peak RSS {result['peak_rss_mb']:7.0f} MB  "
+                  f"file {result['size_mb']:6.1f} MB")
@@ -0,0 +1,35 @@
+"""Sequential vs. concurrent check_availability against the local replay server.
+
+    python -m benchmarks.bench_fetch --urls 200 --latency 0.1
+"""
+import argparse
+import time
+
+from benchmarks.replay_server import ReplayServer
+from fetcher import check_availability_many
+
+
+def run(urls, **limits):
+    start = time.perf_counter()
+    results = check_availability_many(urls, **limits)
+    elapsed = time.perf_counter() - start
+    return sum(1 for result in results if result), elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server = ReplayServer(latency=args.latency).start()
+    urls = server.product_urls(args.urls)
+
+    for label, limits in [
+        ("sequential", dict(max_concurrency=1, per_host_limit=1)),
+        ("concurrent", dict(max_concurrency=32, per_host_limit=32)),
+    ]:
+        found, elapsed = run(urls, **limits)
+        print(f"{label:<12} {found}/{len(urls)} records in {elapsed:.2f}s ({len(urls) / elapsed:.1f} urls/sec)")
+
+    server.shutdown()
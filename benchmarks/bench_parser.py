@@ -0,0 +1,37 @@
+"""Pages/sec for each product_parser backend over a corpus of saved product pages.
+
+    python -m benchmarks.bench_parser --corpus benchmarks/corpus --repeat 50
+
+Every backend is also checked against the BeautifulSoup result for each page.
+"""
+import argparse
+import time
+
+from benchmarks.replay_server import CORPUS_DIR, load_corpus
+from product_parser import available_backends, extract_fields
+
+
+def bench(backend, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            extract_fields(html, backend)
+    return len(pages) * repeat / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = [body.decode("utf-8") for body in load_corpus(args.corpus).values()]
+    expected = [extract_fields(html, "bs4") for html in pages]
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.0f} KiB on average")
+
+    baseline = None
+    for backend in reversed(available_backends()):
+        mismatches = sum(extract_fields(html, backend) != fields for html, fields in zip(pages, expected))
+        rate = bench(backend, pages, args.repeat)
+        baseline = baseline or rate
+        print(f"{backend:<8} {rate:8.1f} pages/sec  {rate / baseline:5.1f}x  {mismatches} mismatches")
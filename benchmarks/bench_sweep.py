@@ -0,0 +1,168 @@
+"""End-to-end sweeps against the replay server: URLs/sec, CPU time and peak memory.
+
+    python -m benchmarks.bench_sweep --urls 600 --hosts 4 --latency 0.1 --error-rate 0.02 --disconnect-rate 0.01
+    python -m benchmarks.bench_sweep --save baseline.json
+    python -m benchmarks.bench_sweep --baseline baseline.json
+
+Starts one replay server per host, 127.0.0.1 to 127.0.0.<hosts>, so the
+per-host limits and rate limiters work like they do over the live markets
+(on macOS the extra addresses need an lo0 alias, or use --hosts 1). Every host
+stands for one country/brand group. The scraper entry points run each in their
+own process, so CPU time and peak RSS belong to that run alone:
+- check_availability: scheduledstart.check_availability one URL at a time,
+  over the first --sample URLs
+- process_urls: scheduledstart.process_urls per group, fetch and parse only
+- check_stock: scheduledstart.check_stock over all groups into a temporary
+  database, --sweeps times; later sweeps see the page cache and schedule of
+  the earlier ones
+
+CPU time includes the parser processes. With --save the results are written
+to a JSON file, and --baseline prints the change against such a file.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.replay_server import ReplayServer
+from url_info import market_groups
+
+MODES = ["check_availability", "process_urls", "check_stock"]
+
+
+def group_urls(servers, count):
+    """Spreads count product URLs over the servers; {"NLShark": [url, ...]} with one group per server."""
+    groups = market_groups()
+    grouped = {}
+    for index, server in enumerate(servers):
+        share = count // len(servers) + (index < count % len(servers))
+        grouped.setdefault(groups[index % len(groups)], []).extend(server.product_urls(share))
+    return grouped
+
+
+def run_mode(mode, grouped, db_name, sample, sweeps):
+    # Runs in the child process; returns the URLs handed to the scraper and how many came back with a record
+    from scheduledstart import check_availability, check_stock, process_urls
+    from schema import migrate
+
+    urls = [url for group in grouped.values() for url in group]
+    if mode == "check_availability":
+        urls = urls[:sample]
+        return len(urls), sum(1 for url in urls if check_availability(url))
+    if mode == "process_urls":
+        checked = 0
+        for group in grouped.values():
+            out_of_stock, in_stock, skipped, _ = process_urls(group)
+            checked += len(group) - len(skipped)
+        return len(urls), checked
+    migrate(db_name)
+    checked = 0
+    for _ in range(sweeps):
+        summary = check_stock(grouped, kind="bench", db_name=db_name)
+        # out and in count products, once per SKU; skipped counts URLs
+        checked += len(urls) - sum(counts["skipped"] for counts in summary.values())
+    return len(urls) * sweeps, checked
+
+
+def child(spec_path):
+    from pipeline import shutdown_parse_pool
+
+    with open(spec_path) as f:
+        spec = json.load(f)
+    start_times = os.times()
+    start = time.perf_counter()
+    urls, checked = run_mode(spec["mode"], spec["grouped"], spec["db_name"], spec["sample"], spec["sweeps"])
+    seconds = time.perf_counter() - start
+    # Reaps the parser processes, so their CPU time and memory are counted below
+    shutdown_parse_pool()
+    end_times = os.times()
+    print(json.dumps({
+        "urls": urls,
+        "checked": checked,
+        "seconds": seconds,
+        "urls_per_second": urls / seconds if seconds else 0.0,
+        "cpu_seconds": sum(end_times[:4]) - sum(start_times[:4]),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "parser_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def run_child(mode, grouped, tmp, sample, sweeps):
+    spec_path = os.path.join(tmp, f"{mode}.json")
+    with open(spec_path, "w") as f:
+        json.dump({"mode": mode, "grouped": grouped, "db_name": os.path.join(tmp, f"{mode}.db"),
+                   "sample": sample, "sweeps": sweeps}, f)
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_sweep", "--child", spec_path],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def change(value, baseline):
+    if not baseline:
+        return ""
+    return f" ({(value - baseline) / baseline:+.0%})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=600)
+    parser.add_argument("--hosts", type=int, default=4, help="replay servers, each on its own loopback address")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.05, help="up to this many seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="fraction of requests whose connection is dropped")
+    parser.add_argument("--etags", action="store_true", help="let the servers answer conditional requests with 304")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--sample", type=int, default=50, help="URLs for the one-at-a-time check_availability")
+    parser.add_argument("--sweeps", type=int, default=1, help="check_stock sweeps over the same database")
+    parser.add_argument("--save", metavar="PATH", help="write the results to this JSON file")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with results saved by --save")
+    parser.add_argument("--child", metavar="SPEC", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        sys.exit(0)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    servers = [ReplayServer(latency=args.latency, etags=args.etags, host=f"127.0.0.{index + 1}", jitter=args.jitter,
+                            error_rate=args.error_rate, disconnect_rate=args.disconnect_rate, seed=args.seed + index)
+               .start() for index in range(args.hosts)]
+    grouped = group_urls(servers, args.urls)
+    print(f"{args.urls} URLs over {args.hosts} hosts, latency {args.latency}s + up to {args.jitter}s, "
+          f"{args.error_rate:.0%} errors, {args.disconnect_rate:.0%} disconnects")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            before = [dict(server.stats) for server in servers]
+            result = run_child(mode, grouped, tmp, args.sample, args.sweeps)
+            result.update({key: sum(server.stats[key] - stats[key] for server, stats in zip(servers, before))
+                           for key in ["requests", "errors", "disconnects"]})
+            results[mode] = result
+            base = baseline.get(mode, {})
+            print(f"{mode:<19} {result['checked']:>5}/{result['urls']:<5} in {result['seconds']:6.1f}s  "
+                  f"{result['urls_per_second']:7.1f} URLs/sec{change(result['urls_per_second'], base.get('urls_per_second'))}  "
+                  f"CPU {result['cpu_seconds']:6.1f}s{change(result['cpu_seconds'], base.get('cpu_seconds'))}  "
+                  f"peak RSS {result['peak_rss_mb']:4.0f} MB{change(result['peak_rss_mb'], base.get('peak_rss_mb'))}"
+                  f" (parsers {result['parser_peak_rss_mb']:.0f} MB)  "
+                  f"{result['requests']} requests, {result['errors']} errors, {result['disconnects']} disconnects")
+
+    for server in servers:
+        server.shutdown()
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"args": {key: value for key, value in vars(args).items()
+                                if key not in ("save", "baseline", "child")},
+                       "results": results}, f, indent=2)
+        print(f"Saved to {args.save}")
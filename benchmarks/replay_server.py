@@ -0,0 +1,137 @@
+"""Local stand-in for the ninjakitchen/sharkclean product pages.
+
+Serves the recorded pages in benchmarks/corpus, so the scrapers can be run
+without touching the live sites. Any path ending in zid<SKU> gets <SKU>.html.
+Like the live sites under load, it can be slow, answer 503 and drop connections:
+
+    python -m benchmarks.replay_server --port 8765 --latency 0.2 --jitter 0.1 --error-rate 0.02 --disconnect-rate 0.01
+"""
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    pages = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(corpus_dir, name), "rb") as f:
+                pages[name[:-5]] = f.read()
+    return pages
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        latency, outcome = server.draw()
+        if latency:
+            time.sleep(latency)
+        if outcome == "disconnect":
+            # Close without answering; the client sees the connection reset or the remote end hang up
+            self.close_connection = True
+            return
+        if outcome == "error":
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        path = self.path.split("?", 1)[0]
+        sku = path.rsplit("zid", 1)[1] if "zid" in path else None
+        body = server.pages.get(sku)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = f'"{hashlib.md5(body).hexdigest()}"' if server.etags else None
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, corpus_dir=CORPUS_DIR, etags=False, host="127.0.0.1", jitter=0.0,
+                 error_rate=0.0, disconnect_rate=0.0, seed=None):
+        super().__init__((host, port), ReplayHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.etags = etags
+        self.pages = load_corpus(corpus_dir)
+        self.stats = {"requests": 0, "errors": 0, "disconnects": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Picks the latency and outcome of one request: "ok", "error" (a 503) or "disconnect"."""
+        with self._lock:
+            latency = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            roll = self._random.random()
+            if roll < self.disconnect_rate:
+                outcome = "disconnect"
+            elif roll < self.disconnect_rate + self.error_rate:
+                outcome = "error"
+            else:
+                outcome = "ok"
+            self.stats["requests"] += 1
+            if outcome != "ok":
+                self.stats[outcome + "s"] += 1
+        return latency, outcome
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def product_urls(self, count):
+        """Returns count product URLs cycling over the corpus."""
+        skus = list(self.pages)
+        return [f"{self.base_url}/product/item-{i}-zid{skus[i % len(skus)]}" for i in range(count)]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="fraction of requests whose connection is closed without an answer")
+    parser.add_argument("--seed", type=int, help="seed for the latency, error and disconnect draws")
+    parser.add_argument("--etags", action="store_true", help="send ETags and answer conditional requests with 304")
+    args = parser.parse_args()
+
+    server = ReplayServer(args.port, args.latency, etags=args.etags, host=args.host, jitter=args.jitter,
+                          error_rate=args.error_rate, disconnect_rate=args.disconnect_rate, seed=args.seed)
+    print(f"Serving {len(server.pages)} recorded pages on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,115 @@
+"""Rewrites ProductStatus into a change-only event log.
+
+    python compact_history.py [--db Sharkninja.db] [--dry-run] [--no-vacuum]
+
+Before save_products only wrote changes, every sweep added a row per product
+even when nothing had changed. This keeps the first row of every product and
+country plus each row whose status or price differs from the row before it, and
+deletes the rest. The latest scrape date of every product is kept in
+ProductLastSeen first. Stock episodes only depend on status changes, so they
+stay the same. The database is vacuumed afterwards to give the space back to
+the file system, and the rows and bytes saved are reported.
+"""
+import argparse
+import logging
+import os
+
+from data_versions import STOCK, bump_version
+from db import close_all, connect, writer
+from schema import migrate
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+
+REFRESH_LAST_SEEN = """
+    INSERT INTO ProductLastSeen (ProductID, CountryID, BrandID, LastSeen, Status, Type, CurrentPrice)
+    SELECT ProductID, CountryID, BrandID, Date, Status, Type, CurrentPrice
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY ProductID, CountryID ORDER BY Date DESC) AS rn
+        FROM ProductStatus
+    )
+    WHERE rn = 1
+    ON CONFLICT (ProductID, CountryID) DO UPDATE SET
+        BrandID = excluded.BrandID, LastSeen = excluded.LastSeen, Status = excluded.Status,
+        Type = excluded.Type, CurrentPrice = excluded.CurrentPrice
+    WHERE excluded.LastSeen > ProductLastSeen.LastSeen
+    """
+
+# Rows that repeat the status and price of the previous row of the same product and country
+UNCHANGED_ROWS = """
+    SELECT rowid FROM (
+        SELECT rowid, Status, CurrentPrice,
+               LAG(Status) OVER w AS PrevStatus,
+               LAG(CurrentPrice) OVER w AS PrevPrice,
+               ROW_NUMBER() OVER w AS rn
+        FROM ProductStatus
+        WINDOW w AS (PARTITION BY ProductID, CountryID ORDER BY Date)
+    )
+    WHERE rn > 1 AND Status IS PrevStatus AND CurrentPrice IS PrevPrice
+    """
+
+
+def file_size(db_name):
+    return sum(os.path.getsize(path) for path in (db_name, db_name + "-wal") if os.path.exists(path))
+
+
+def vacuum(db_name):
+    conn = connect(db_name)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def compact(db_name=DB_NAME, dry_run=False, vacuum_after=True):
+    """Deletes unchanged ProductStatus rows; returns a dict with row counts and file sizes."""
+    migrate(db_name)
+    size_before = file_size(db_name)
+    with writer(db_name) as conn:
+        rows_before = conn.execute("SELECT COUNT(*) FROM ProductStatus").fetchone()[0]
+        if dry_run:
+            removed = conn.execute(f"SELECT COUNT(*) FROM ({UNCHANGED_ROWS})").fetchone()[0]
+        else:
+            conn.execute(REFRESH_LAST_SEEN)
+            removed = conn.execute(f"DELETE FROM ProductStatus WHERE rowid IN ({UNCHANGED_ROWS})").rowcount
+            if removed:
+                bump_version(conn, STOCK)
+
+    if not dry_run and vacuum_after:
+        # VACUUM needs every other connection of this process to be idle
+        close_all()
+        vacuum(db_name)
+    return {
+        "rows_before": rows_before,
+        "rows_removed": removed,
+        "size_before": size_before,
+        "size_after": file_size(db_name),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be removed")
+    parser.add_argument("--no-vacuum", action="store_true", help="leave the freed pages in the file for reuse")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    result = compact(args.db, args.dry_run, not args.no_vacuum)
+    rows_before, removed = result["rows_before"], result["rows_removed"]
+    share = removed / rows_before if rows_before else 0
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {removed:,} of {rows_before:,} ProductStatus rows ({share:.0%}), "
+          f"{rows_before - removed:,} status changes left")
+    if not args.dry_run:
+        saved = result["size_before"] - result["size_after"]
+        print(f"Database file: {result['size_before'] / 1e6:,.1f} MB -> {result['size_after'] / 1e6:,.1f} MB "
+              f"({saved / 1e6:,.1f} MB saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import sqlite3
+
+from db import reader
+
+# Names of the counters; writers bump them after committing, readers compare them to what they cached
+DIMENSIONS = "dimensions"
+STOCK = "stock"         # ProductStatus, ProductLastSeen, StockEpisodes
+PRICES = "prices"
+RUNS = "runs"           # ScrapeRuns, ScrapeRunHosts
+
+
+def ensure_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS DataVersions (
+            Name TEXT PRIMARY KEY,
+            Version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def get_version(conn, name):
+    try:
+        row = conn.execute("SELECT Version FROM DataVersions WHERE Name = ?", (name,)).fetchone()
+    except sqlite3.OperationalError:
+        # Table not created yet: nothing has been bumped
+        return 0
+    return row[0] if row else 0
+
+
+def bump_version(conn, name):
+    """Increments the counter; runs inside the caller's transaction."""
+    ensure_table(conn)
+    conn.execute("""
+        INSERT INTO DataVersions (Name, Version) VALUES (?, 1)
+        ON CONFLICT(Name) DO UPDATE SET Version = Version + 1
+    """, (name,))
+
+
+def current_versions(names, db_name="Sharkninja.db"):
+    """Returns the counters for names as a tuple, e.g. as part of a cache key."""
+    with reader(db_name) as conn:
+        return tuple(get_version(conn, name) for name in names)
@@ -0,0 +1,191 @@
+"""Shared SQLite connections for Sharkninja.db.
+
+The scheduled job, the standalone daemon and the Streamlit pages all use the
+same database file. Every connection runs in WAL mode, so readers never block
+the writer and the writer never blocks readers. Writes in this process go
+through one connection behind a lock and start with BEGIN IMMEDIATE. Other
+processes are queued by SQLite's busy_timeout instead of sleep-and-retry loops.
+Time spent waiting for the write lock is recorded and can be logged with
+log_lock_stats().
+
+    with reader() as conn:
+        df = pd.read_sql_query(query, conn)
+
+    with writer() as conn:
+        conn.execute("INSERT ...")   # committed on exit, rolled back on error
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+BUSY_TIMEOUT_MS = 30000
+MAX_IDLE_READERS = 4        # read connections kept open per database
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",    # safe in WAL mode; only the last commits can be lost on power failure
+    "cache_size": -65536,       # 64 MB page cache
+    "mmap_size": 268435456,     # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+}
+
+
+def connect(db_name=DB_NAME, read_only=False):
+    """Opens a connection with the shared pragmas applied.
+
+    The connection is in autocommit mode; reader() and writer() manage transactions.
+    """
+    conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class LockStats:
+    """How long writers waited for the write lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            self.acquisitions += not timed_out
+            self.timeouts += timed_out
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+                "mean_wait_seconds": self.wait_seconds / self.acquisitions if self.acquisitions else 0.0,
+            }
+
+
+class Database:
+    """Long-lived connections to one database file: a pool of readers and a single writer."""
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self._readers = queue.LifoQueue()
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._depth = 0
+        self.lock_stats = LockStats()
+
+    @contextmanager
+    def reader(self):
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = connect(self.db_name, read_only=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._readers.qsize() < MAX_IDLE_READERS:
+                self._readers.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        start = time.perf_counter()
+        with self._write_lock:
+            if self._depth:
+                # Nested use joins the outer transaction
+                self._depth += 1
+                try:
+                    yield self._writer
+                finally:
+                    self._depth -= 1
+                return
+
+            if self._writer is None:
+                self._writer = connect(self.db_name)
+            conn = self._writer
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                self.lock_stats.record(time.perf_counter() - start, timed_out=True)
+                raise
+            self.lock_stats.record(time.perf_counter() - start)
+
+            self._depth = 1
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._depth = 0
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_name=DB_NAME):
+    """Returns the process-wide Database for db_name."""
+    with _databases_lock:
+        if db_name not in _databases:
+            _databases[db_name] = Database(db_name)
+        return _databases[db_name]
+
+
+def reader(db_name=DB_NAME):
+    """Borrows a read-only connection; use as a context manager."""
+    return get_database(db_name).reader()
+
+
+def writer(db_name=DB_NAME):
+    """Runs the block in one write transaction on the process's writer connection."""
+    return get_database(db_name).writer()
+
+
+def lock_stats(db_name=DB_NAME):
+    return get_database(db_name).lock_stats.summary()
+
+
+def log_lock_stats(log=logger, db_name=DB_NAME):
+    s = lock_stats(db_name)
+    log.info(f"Write lock: {s['acquisitions']} transactions, waited {s['wait_seconds']:.2f}s in total "
+             f"(mean {s['mean_wait_seconds'] * 1000:.1f} ms, max {s['max_wait_seconds'] * 1000:.1f} ms), "
+             f"{s['timeouts']} timeouts")
+
+
+def close_all():
+    with _databases_lock:
+        for database in _databases.values():
+            database.close()
+        _databases.clear()
@@ -0,0 +1,224 @@
+import logging
+import sqlite3
+from collections import namedtuple
+from datetime import timedelta
+
+import pandas as pd
+
+from data_versions import PRICES, STOCK, bump_version
+from db import writer
+from dimension_cache import get_cache
+from episodes import update_episodes
+from queries import LAST_SEEN, LATEST_PRICES
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# How a price change is written: the previous price at (scrape date - last_offset) formatted
+# with last_format, then the new price at the scrape date
+PriceHistory = namedtuple("PriceHistory", "last_reason last_offset last_format new_reason")
+SCHEDULED = PriceHistory("Last known price", timedelta(hours=1), DATE_FORMAT, "Newly scraped price")
+STANDALONE = PriceHistory("Last recorded price", timedelta(days=1), "%Y-%m-%d", "New scraped price")
+
+
+def _record_failures(db_name, rows, error):
+    try:
+        with writer(db_name) as conn:
+            conn.executemany("""
+                INSERT INTO FailedInserts
+                (SKU, ProductName, Country, Brand, Date, URL, Status, Type, CurrentPrice, ErrorMessage)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(sku, name, country, brand, date, url, status, product_type, price, error)
+                  for sku, name, date, url, status, product_type, price, country, brand in rows])
+    except sqlite3.Error as e:
+        logger.error(f"Could not record {len(rows)} failed inserts: {e}")
+
+
+def _batch_keys(conn, keys):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS BatchKeys (ProductID INTEGER, CountryID INTEGER)")
+    conn.execute("DELETE FROM temp.BatchKeys")
+    conn.executemany("INSERT INTO temp.BatchKeys (ProductID, CountryID) VALUES (?, ?)", keys)
+
+
+def _last_seen(conn, keys):
+    _batch_keys(conn, keys)
+    return {(product_id, country_id): (last_seen, status, price)
+            for product_id, country_id, last_seen, status, price in conn.execute(LAST_SEEN)}
+
+
+def changed_statuses(statuses, last_seen):
+    """Returns the statuses whose stock status or price differs from the last known state.
+
+    statuses are ProductStatus tuples (ProductID, CountryID, BrandID, Date, Status,
+    Type, CurrentPrice); last_seen maps (ProductID, CountryID) to (LastSeen,
+    Status, CurrentPrice) and is updated as the batch is walked in date order.
+    """
+    changes = []
+    for status in sorted(statuses, key=lambda s: s[3]):
+        key = status[:2]
+        last = last_seen.get(key)
+        if last is None or (status[4], status[6]) != (last[1], last[2]):
+            changes.append(status)
+        if last is None or status[3] >= last[0]:
+            last_seen[key] = (status[3], status[4], status[6])
+    return changes
+
+
+def save_products(rows, db_name=DB_NAME):
+    """Writes scraped products to the database in a single transaction.
+
+    rows are the scraper's 7-tuple records extended with (country, brand). Country,
+    Brand, Product and URL IDs come from the dimension cache, which only goes to
+    the database for values it hasn't seen. Every product's last known state and
+    heartbeat go to ProductLastSeen; ProductStatus, the event log, only gets a
+    row when the status or price changed, and StockEpisodes is updated in the
+    same transaction. Rows that can't be stored end up in FailedInserts.
+    Returns the number of rows saved.
+    """
+    rows = [tuple(row) for row in rows]
+    valid = [row for row in rows if row[0] and row[7] and row[8]]
+    invalid = [row for row in rows if not (row[0] and row[7] and row[8])]
+
+    if invalid:
+        logger.error(f"{len(invalid)} rows without SKU, country or brand")
+        _record_failures(db_name, invalid, "Missing SKU, country or brand")
+    if not valid:
+        return 0
+
+    cache = get_cache(db_name)
+    try:
+        with writer(db_name) as conn:
+            cursor = conn.cursor()
+            cache.sync(conn)
+            product_names = {row[0]: row[1] for row in valid}
+            country_ids = cache.resolve(conn, "Countries", {row[7] for row in valid})
+            brand_ids = cache.resolve(conn, "Brands", {row[8] for row in valid})
+            product_ids = cache.resolve(conn, "Products", product_names, product_names)
+            url_ids = cache.resolve(conn, "URLs", {row[3] for row in valid})
+
+            cursor.executemany(
+                "INSERT OR IGNORE INTO SKU_URL (SKUID, URLID) VALUES (?, ?)",
+                {(product_ids[row[0]], url_ids[row[3]]) for row in valid},
+            )
+            statuses = [(product_ids[sku], country_ids[country], brand_ids[brand], date, status, product_type, price)
+                        for sku, _, date, _, status, product_type, price, country, brand in valid]
+            changes = changed_statuses(statuses, _last_seen(conn, {status[:2] for status in statuses}))
+            cursor.executemany("""
+                INSERT OR REPLACE INTO ProductStatus
+                (ProductID, CountryID, BrandID, Date, Status, Type, CurrentPrice)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, changes)
+            cursor.executemany("""
+                INSERT INTO ProductLastSeen
+                (ProductID, CountryID, BrandID, LastSeen, Status, Type, CurrentPrice)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ProductID, CountryID) DO UPDATE SET
+                    BrandID = excluded.BrandID, LastSeen = excluded.LastSeen, Status = excluded.Status,
+                    Type = excluded.Type, CurrentPrice = excluded.CurrentPrice
+                WHERE excluded.LastSeen >= ProductLastSeen.LastSeen
+            """, sorted(statuses, key=lambda s: s[3]))
+            update_episodes(conn, [status[:5] for status in changes])
+            bump_version(conn, STOCK)
+        logger.info(f"Saved {len(valid)} products, {len(changes)} with a new status or price")
+        return len(valid)
+    except Exception as e:
+        logger.error(f"Error saving {len(valid)} products: {e}")
+        # IDs inserted by the rolled back transaction may already be cached
+        cache.invalidate()
+        _record_failures(db_name, valid, str(e))
+        return 0
+
+
+def parse_prices(prices):
+    """Turns scraped price strings like "€ 1.299,99" into floats; NaN where there is no price."""
+    prices = pd.Series(prices, dtype=object).astype(str)
+    prices = prices.str.replace("€", "", regex=False).str.replace(r"\s", "", regex=True)
+    # A dot is a thousands separator when the string also has a decimal comma
+    prices = prices.where(~prices.str.contains(","), prices.str.replace(".", "", regex=False))
+    return pd.to_numeric(prices.str.replace(",", ".", regex=False), errors="coerce")
+
+
+def _latest_prices(conn, keys):
+    _batch_keys(conn, keys)
+    return pd.read_sql_query(LATEST_PRICES, conn)
+
+
+def save_prices(rows, db_name=DB_NAME, history=SCHEDULED):
+    """Records price changes for a batch of scraped products in a single transaction.
+
+    Takes the same rows as save_products. The last known price of every
+    (product, country) in the batch is read with one windowed query, changes are
+    found with vectorised pandas comparisons, and all new Prices rows are written
+    with one executemany. history keeps each script's rows as they were:
+    - no earlier price: "First recorded price"
+    - changed price, SCHEDULED: "Last known price" one hour before the scrape, then "Newly scraped price"
+    - changed price, STANDALONE: "Last recorded price" on the day before, then "New scraped price"
+    A row that already exists for the same product, country and EntryDate is kept;
+    such collisions are counted and logged. (The scripts used to fail the batch.)
+    Returns a dict with the number of products per outcome.
+    """
+    batch = pd.DataFrame([tuple(row)[:9] for row in rows],
+                         columns=["SKU", "ProductName", "Date", "URL", "Status", "Type", "PriceText", "Country", "Brand"])
+    batch["Price"] = parse_prices(batch["PriceText"])
+    unpriced = batch["Price"].isna() | batch["SKU"].isna() | batch["Country"].isna()
+    if unpriced.any():
+        logger.warning(f"Skipping {int(unpriced.sum())} products without a usable price: "
+                       + ", ".join(map(str, batch.loc[unpriced, "SKU"])))
+    batch = batch[~unpriced]
+    summary = {"first": 0, "changed": 0, "unchanged": 0, "skipped": int(unpriced.sum()), "collisions": 0}
+    if batch.empty:
+        return summary
+
+    cache = get_cache(db_name)
+    try:
+        with writer(db_name) as conn:
+            cache.sync(conn)
+            names = dict(zip(batch["SKU"], batch["ProductName"]))
+            product_ids = cache.resolve(conn, "Products", names, names)
+            country_ids = cache.resolve(conn, "Countries", set(batch["Country"]))
+            batch["ProductID"] = batch["SKU"].map(product_ids)
+            batch["CountryID"] = batch["Country"].map(country_ids)
+            # One price per product and country; the last scrape wins
+            batch = batch.drop_duplicates(["ProductID", "CountryID"], keep="last")
+
+            keys = list(zip(batch["ProductID"].tolist(), batch["CountryID"].tolist()))
+            batch = batch.merge(_latest_prices(conn, keys), on=["ProductID", "CountryID"], how="left")
+            last_price = pd.to_numeric(batch["LastPrice"], errors="coerce")
+            date = pd.to_datetime(batch["Date"], format=DATE_FORMAT)
+
+            first = last_price.isna()
+            changed = ~first & (batch["Price"].round(2) != last_price.round(2))
+
+            scraped_at = date.dt.strftime(DATE_FORMAT)
+            entries = pd.concat([
+                pd.DataFrame({"ProductID": batch["ProductID"], "CountryID": batch["CountryID"], "Price": batch["Price"],
+                              "EntryDate": scraped_at, "Reason": "First recorded price"})[first],
+                pd.DataFrame({"ProductID": batch["ProductID"], "CountryID": batch["CountryID"], "Price": last_price,
+                              "EntryDate": (date - history.last_offset).dt.strftime(history.last_format),
+                              "Reason": history.last_reason})[changed],
+                pd.DataFrame({"ProductID": batch["ProductID"], "CountryID": batch["CountryID"], "Price": batch["Price"],
+                              "EntryDate": scraped_at, "Reason": history.new_reason})[changed],
+            ])
+            cursor = conn.executemany("""
+                INSERT OR IGNORE INTO Prices (ProductID, CountryID, Price, EntryDate, Reason)
+                VALUES (?, ?, ?, ?, ?)
+            """, entries.astype(object).itertuples(index=False, name=None))
+            summary["collisions"] = len(entries) - cursor.rowcount
+            if cursor.rowcount:
+                bump_version(conn, PRICES)
+
+        for row in batch[changed].itertuples(index=False):
+            logger.info(f"Price changed for ProductID {row.ProductID}. Old: {row.LastPrice}, New: {row.Price}")
+        summary.update(first=int(first.sum()), changed=int(changed.sum()), unchanged=int((~first & ~changed).sum()))
+        logger.info(f"Prices: {summary['first']} first, {summary['changed']} changed, "
+                    f"{summary['unchanged']} unchanged, {summary['skipped']} skipped")
+        if summary["collisions"]:
+            logger.warning(f"Kept {summary['collisions']} existing Prices rows with the same product, country and "
+                           f"EntryDate instead of the new ones")
+        return summary
+    except Exception:
+        cache.invalidate()
+        raise
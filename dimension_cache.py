@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+
+from data_versions import DIMENSIONS, get_version
+from db import writer
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+CHUNK_SIZE = 500            # values per IN (...) lookup, well under SQLite's variable limit
+VERSION_CHECK_SECONDS = 5   # how often single lookups look for changes made by other processes
+
+# table: (key column, id column)
+TABLES = {
+    "Countries": ("CountryCode", "CountryID"),
+    "Brands": ("BrandName", "BrandID"),
+    "Products": ("SKU", "ProductID"),
+    "URLs": ("URL", "rowid"),
+}
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class DimensionCache:
+    """In-memory copy of the Countries, Brands, Products and URLs lookup tables.
+
+    IDs are served from memory; unknown values are inserted (write-through) and
+    looked up set-based. The URL manager and the price manager bump the
+    "dimensions" data version when they add or remove rows, which makes the next
+    sync() reload everything.
+    """
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self._ids = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+        self.hits = {table: 0 for table in TABLES}
+        self.misses = {table: 0 for table in TABLES}
+
+    def _load(self, conn):
+        self._ids = {}
+        for table, (key_column, id_column) in TABLES.items():
+            self._ids[table] = dict(conn.execute(f"SELECT {key_column}, {id_column} FROM {table}").fetchall())
+        logger.info("Loaded dimension cache: " + ", ".join(f"{len(ids)} {table}" for table, ids in self._ids.items()))
+
+    def sync(self, conn):
+        """Reloads the cache if another writer changed the lookup tables since the last load."""
+        with self._lock:
+            version = get_version(conn, DIMENSIONS)
+            self._checked_at = time.monotonic()
+            if self._ids is None or version != self._version:
+                self._load(conn)
+                self._version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+    def resolve(self, conn, table, values, names=None):
+        """Returns {value: id} for all values, inserting the ones that don't exist yet.
+
+        Runs on the caller's connection and transaction. names maps SKU to
+        ProductName for new Products rows. If the transaction is rolled back,
+        call invalidate(), since new IDs have already been cached.
+        """
+        key_column, id_column = TABLES[table]
+        with self._lock:
+            if self._ids is None:
+                self.sync(conn)
+            cached = self._ids[table]
+            values = set(values)
+            missing = [value for value in values if value not in cached]
+            self.hits[table] += len(values) - len(missing)
+            self.misses[table] += len(missing)
+
+            if missing:
+                if table == "Products":
+                    conn.executemany("INSERT OR IGNORE INTO Products (SKU, ProductName) VALUES (?, ?)",
+                                     [(sku, (names or {}).get(sku)) for sku in missing])
+                else:
+                    conn.executemany(f"INSERT OR IGNORE INTO {table} ({key_column}) VALUES (?)",
+                                     [(value,) for value in missing])
+                for chunk in _chunks(missing):
+                    placeholders = ", ".join("?" * len(chunk))
+                    cached.update(conn.execute(
+                        f"SELECT {key_column}, {id_column} FROM {table} WHERE {key_column} IN ({placeholders})", chunk
+                    ).fetchall())
+
+            return {value: cached[value] for value in values}
+
+    def get_id(self, table, value, name=None):
+        """Single lookup for the get_or_create_id style helpers."""
+        with self._lock:
+            if self._ids is not None and value in self._ids[table] \
+                    and time.monotonic() - self._checked_at < VERSION_CHECK_SECONDS:
+                self.hits[table] += 1
+                return self._ids[table][value]
+
+        # Take the write lock before the cache lock, in the same order as the batch writers
+        try:
+            with writer(self.db_name) as conn:
+                self.sync(conn)
+                return self.resolve(conn, table, [value], {value: name})[value]
+        except Exception:
+            self.invalidate()
+            raise
+
+    def stats(self):
+        stats = {}
+        for table in TABLES:
+            lookups = self.hits[table] + self.misses[table]
+            stats[table] = {
+                "hits": self.hits[table],
+                "misses": self.misses[table],
+                "hit_rate": self.hits[table] / lookups if lookups else 0.0,
+            }
+        return stats
+
+    def log_stats(self, log=logger):
+        log.info("Dimension cache: " + ", ".join(
+            f"{table} {s['hits']}/{s['hits'] + s['misses']} hits ({s['hit_rate']:.0%})"
+            for table, s in self.stats().items()
+        ))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db_name=DB_NAME):
+    """Returns the process-wide cache for db_name."""
+    with _caches_lock:
+        if db_name not in _caches:
+            _caches[db_name] = DimensionCache(db_name)
+        return _caches[db_name]
@@ -0,0 +1,115 @@
+"""Out-of-stock episodes.
+
+An episode starts at an OUT status whose previous status was IN (or that is the
+first status of the product), and ends at the next IN status. The StockEpisodes
+table holds them for the dashboard: db_writer.save_products opens and closes
+episodes as statuses flip (update_episodes), so reading them costs as much as
+there are episodes, whatever the size of the ProductStatus history.
+
+stock_episodes computes the same episodes from the raw status rows in one
+ordered pass; episodes_from_log uses it to check the table against the log.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from db import reader
+from queries import STATUS_HISTORY
+
+# Constants
+DB_NAME = "Sharkninja.db"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+COLUMNS = ["SKU", "OutOfStockDate", "BackInStockDate", "DaysOutOfStock"]
+
+
+def stock_episodes(history, now=None):
+    """Turns status rows into episodes.
+
+    history has SKU, DateTime ("YYYY-MM-DD HH:MM:SS") and Status columns, ordered
+    by SKU and then DateTime. Returns one row per episode with its start, its end
+    (None while the product is still out of stock) and its length in whole days,
+    at least 1 for finished episodes. Open episodes are measured up to now,
+    which is UTC like SQLite's julianday('now') used by the dashboard before.
+    """
+    if history.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    if now is None:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    sku = history["SKU"].to_numpy()
+    status = history["Status"].to_numpy(dtype=object)
+    times = pd.to_datetime(history["DateTime"], format=DATE_FORMAT).reset_index(drop=True)
+
+    new_sku = np.r_[True, sku[1:] != sku[:-1]]
+    last_of_sku = np.r_[new_sku[1:], True]
+    previous = np.r_[None, status[:-1]]
+    previous[new_sku] = None
+    starts = (status == "OUT") & (pd.isna(previous) | (previous == "IN"))
+
+    # Time of the first IN after each row within the same SKU: shift the IN times
+    # up by one row, then fill them backwards per SKU
+    following_in = times.where(status == "IN").shift(-1)
+    following_in[last_of_sku] = pd.NaT
+    next_in = following_in.groupby(sku).bfill()
+
+    out_at = times[starts]
+    back_at = next_in[starts]
+    days = np.where(
+        back_at.notna(),
+        np.maximum(1, (back_at - out_at).dt.days.fillna(0)),
+        (pd.Timestamp(now) - out_at).dt.days,
+    ).astype("int64")
+
+    episodes = pd.DataFrame({
+        "SKU": sku[starts],
+        "OutOfStockDate": history["DateTime"].to_numpy()[starts],
+        "BackInStockDate": back_at.dt.strftime(DATE_FORMAT).to_numpy(dtype=object),
+        "DaysOutOfStock": days,
+    })
+    episodes["BackInStockDate"] = episodes["BackInStockDate"].where(back_at.notna().to_numpy(), None)
+    return episodes.sort_values(["SKU", "OutOfStockDate"], ascending=[True, False], kind="stable").reset_index(drop=True)
+
+
+def read_status_history(country, brand, db_name=DB_NAME):
+    with reader(db_name) as conn:
+        history = pd.read_sql_query(STATUS_HISTORY, conn, params=(country, brand))
+    # SKU order; rows of one product stay in date order
+    return history.sort_values("SKU", kind="stable").reset_index(drop=True)
+
+
+def episodes_from_log(country, brand, db_name=DB_NAME, now=None):
+    """All out-of-stock episodes of one country and brand, computed from ProductStatus."""
+    return stock_episodes(read_status_history(country, brand, db_name), now)
+
+
+def update_episodes(conn, statuses):
+    """Opens and closes episodes for newly written statuses, inside the caller's transaction.
+
+    statuses are (ProductID, CountryID, BrandID, Date, Status) tuples. An OUT
+    opens an episode unless the product already has an open one in that country;
+    an IN closes the open episode. A product that appears more than once in the
+    batch is handled in date order, one round per occurrence.
+    """
+    rounds = []
+    seen = {}
+    for status in sorted(statuses, key=lambda s: s[3]):
+        key = status[:2]
+        position = seen.get(key, 0)
+        seen[key] = position + 1
+        if position == len(rounds):
+            rounds.append([])
+        rounds[position].append(status)
+
+    for batch in rounds:
+        conn.executemany("""
+            UPDATE StockEpisodes SET BackInAt = ?
+            WHERE ProductID = ? AND CountryID = ? AND BackInAt IS NULL AND OutSince < ?
+        """, [(date, product_id, country_id, date)
+              for product_id, country_id, _, date, status in batch if status == "IN"])
+        # The partial unique index on open episodes makes this a no-op while one is open
+        conn.executemany("""
+            INSERT OR IGNORE INTO StockEpisodes (ProductID, CountryID, BrandID, OutSince)
+            VALUES (?, ?, ?, ?)
+        """, [(product_id, country_id, brand_id, date)
+              for product_id, country_id, brand_id, date, status in batch if status == "OUT"])
@@ -0,0 +1,189 @@
+"""Streaming Excel and CSV exports for the dashboards.
+
+The data is read in chunks (snapshots.iter_range) and written straight to a
+temporary file, so memory use depends on the chunk size rather than on the
+length of the history:
+- Excel: xlsxwriter in constant_memory mode, which flushes every row to disk
+  once the next row is started, per worksheet. A sheet continues on a new
+  sheet after Excel's row limit.
+- CSV, gzip-compressed: much faster to write and smaller to download.
+
+Only writing the file takes constant memory. st.download_button reads the whole
+file into the Streamlit server's memory and keeps it for the session until the
+next rerun, so one download costs the size of the file, not of the DataFrame it
+used to be. For long histories the gzip CSV keeps that small. Serving the file
+from Streamlit's static folder would avoid it, but that folder is public and
+bypasses the login.
+
+    path = export_prices("csv")
+    with open(path, "rb") as f:
+        st.download_button("Download", f, file_name=export_filename("prices", "csv"))
+    os.remove(path)
+"""
+import gzip
+import logging
+import os
+import tempfile
+import time
+
+import xlsxwriter
+
+from snapshots import iter_range
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+EXCEL_MAX_ROWS = 1048576    # including the header row
+FORMATS = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv.gz", "application/gzip"),
+}
+
+
+def export_filename(name, fmt):
+    return f"{name}.{FORMATS[fmt][0]}"
+
+
+def mime_type(fmt):
+    return FORMATS[fmt][1]
+
+
+def _temporary_path(fmt):
+    handle, path = tempfile.mkstemp(suffix="." + FORMATS[fmt][0], prefix="export_")
+    os.close(handle)
+    return path
+
+
+class _Sheet:
+    # One worksheet of rows; continues on a new worksheet after Excel's row limit
+    def __init__(self, workbook, name, columns, header_format):
+        self.workbook = workbook
+        self.name = name
+        self.columns = columns
+        self.header_format = header_format
+        self.part = 1
+        self._add_worksheet(name)
+
+    def _add_worksheet(self, name):
+        self.worksheet = self.workbook.add_worksheet(name)
+        self.worksheet.write_row(0, 0, self.columns, self.header_format)
+        self.row = 1
+
+    def write(self, values):
+        if self.row == EXCEL_MAX_ROWS:
+            self.part += 1
+            self._add_worksheet(f"{self.name[:26]} ({self.part})")
+        _write_values(self.worksheet, self.row, values)
+        self.row += 1
+
+
+def _workbook(path):
+    # Values are written as they are: no URL, number or formula detection in strings
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+    return workbook, workbook.add_format({"bold": True})
+
+
+def write_excel(path, sheets):
+    """Writes sheets, a list of (name, columns, chunks), to an .xlsx file with constant memory.
+
+    chunks is an iterable of DataFrames with the given columns. Returns the number of rows written.
+    """
+    total = 0
+    workbook, bold = _workbook(path)
+    try:
+        for name, columns, chunks in sheets:
+            sheet = _Sheet(workbook, name, columns, bold)
+            for chunk in chunks:
+                for values in chunk[columns].itertuples(index=False, name=None):
+                    sheet.write(values)
+                total += len(chunk)
+    finally:
+        workbook.close()
+    return total
+
+
+def write_excel_split(path, columns, chunks, key, sheet_names):
+    """Writes one pass over chunks to an .xlsx file, a sheet per value of the key column.
+
+    sheet_names maps those values to sheet names, in sheet order; rows with other
+    values are left out. In constant_memory mode every worksheet flushes its own
+    rows, so the sheets can be filled side by side. Returns the number of rows written.
+    """
+    total = 0
+    workbook, bold = _workbook(path)
+    try:
+        sheets = {value: _Sheet(workbook, name, columns, bold) for value, name in sheet_names.items()}
+        index = columns.index(key)
+        for chunk in chunks:
+            for values in chunk[columns].itertuples(index=False, name=None):
+                sheet = sheets.get(values[index])
+                if sheet:
+                    sheet.write(values)
+                    total += 1
+    finally:
+        workbook.close()
+    return total
+
+
+def _write_values(worksheet, row, values):
+    for column, value in enumerate(values):
+        if isinstance(value, str):
+            worksheet.write_string(row, column, value)
+        elif isinstance(value, (int, float)):
+            # NaN is the only value that differs from itself; it stays a blank cell
+            if value == value:
+                worksheet.write_number(row, column, value)
+        elif value is not None:
+            worksheet.write_string(row, column, str(value))
+
+
+def write_csv(path, columns, chunks):
+    """Writes the chunks to a gzip-compressed CSV file. Returns the number of rows written."""
+    total = 0
+    # Level 6 is close to the best ratio at a fraction of the time of level 9
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as f:
+        f.write(",".join(columns) + "\n")
+        for chunk in chunks:
+            chunk[columns].to_csv(f, header=False, index=False)
+            total += len(chunk)
+    return total
+
+
+def _export(fmt, write):
+    # write(path) writes the export to path and returns the number of rows
+    start = time.perf_counter()
+    path = _temporary_path(fmt)
+    try:
+        rows = write(path)
+    except BaseException:
+        os.remove(path)
+        raise
+    logger.info(f"Exported {rows} rows to {path} ({os.path.getsize(path) / 1e6:.1f} MB) "
+                f"in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def export_stock(country, brand, fmt="xlsx", db_name=DB_NAME):
+    """Status history of one country and brand, out-of-stock and in-stock rows on separate sheets.
+
+    The history is read once and split by status as it goes; the CSV is one file
+    with the sheet name in a column. Returns the path of a temporary file; the caller removes it.
+    """
+    columns = ["SKU", "ProductName", "Date", "URL", "Status", "Type", "CurrentPrice", "CountryCode", "BrandName"]
+    sheet_names = {"OUT": "Out of Stock", "IN": "In Stock"}
+    chunks = iter_range("status", db_name, country, brand)
+    if fmt == "xlsx":
+        return _export(fmt, lambda path: write_excel_split(path, columns, chunks, "Status", sheet_names))
+    return _export(fmt, lambda path: write_csv(path, ["Sheet"] + columns, (
+        chunk[chunk["Status"].isin(sheet_names)].assign(Sheet=chunk["Status"].map(sheet_names))
+        for chunk in chunks)))
+
+
+def export_prices(fmt="xlsx", db_name=DB_NAME):
+    """All recorded prices. Returns the path of a temporary file; the caller removes it."""
+    columns = ["SKU", "Price", "EntryDate", "Reason", "Country"]
+    chunks = iter_range("prices", db_name)
+    if fmt == "xlsx":
+        return _export(fmt, lambda path: write_excel(path, [("Prices", columns, chunks)]))
+    return _export(fmt, lambda path: write_csv(path, columns, chunks))
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.exceptions import Timeout
+
+from http_client import HEADERS, POOL_MAXSIZE, get_session, request_timings
+from metrics import RunMetrics
+from page_cache import body_hash
+from product_parser import extract_product
+from rate_limiter import backoff_delay, get_rate_limiter
+from url_info import parse_url
+
+logger = logging.getLogger(__name__)
+
+# Constants
+TIMEOUT_SECONDS = 5
+MAX_CONCURRENCY = POOL_MAXSIZE  # requests in flight over all hosts, per engine and for the whole process
+PER_HOST_LIMIT = 4              # requests in flight per ninjakitchen.* / sharkclean.* host
+RETRIES = 3                     # extra attempts per URL after a timeout, disconnect, 429 or 5xx
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Shared by every engine, so sweeps running side by side (worker threads) together stay within the session's pools
+_in_flight = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+# previous is the carried-forward record when the page cache says the page did not change
+Page = namedtuple("Page", ["body", "encoding", "etag", "last_modified", "digest", "previous"])
+
+
+class RetryableError(Exception):
+    """A failure that may go away later: a timeout, a dropped connection, a 429 or a 5xx."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FetchEngine:
+    """Fetches product pages concurrently with a global and a per-host limit.
+
+    The blocking requests calls run on a thread pool; asyncio only schedules them,
+    so the limits are plain semaphores and a slow host never holds up the others.
+    All engines share the pooled session from http_client, so connections opened
+    by one sweep are reused by the next, and at most MAX_CONCURRENCY requests
+    are in flight over all engines of the process. With a page_cache, requests are
+    conditional and unchanged pages come back with the previous record.
+
+    Failed attempts that are worth retrying are rescheduled with exponential
+    backoff while the other URLs keep going, and every attempt is reported to the
+    per-host rate limiter. Stage timings and the outcome of every attempt go to
+    metrics, a metrics.RunMetrics.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, per_host_limit=PER_HOST_LIMIT,
+                 timeout=TIMEOUT_SECONDS, headers=None, page_cache=None, retries=RETRIES, rate_limiter=None,
+                 metrics=None):
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.headers = headers or HEADERS
+        self.page_cache = page_cache
+        self.retries = retries
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.session = get_session()
+        self.metrics = metrics or RunMetrics("fetch")
+        self.retried = 0
+        self.gave_up = 0
+
+    def _get(self, url):
+        headers = self.headers
+        if self.page_cache:
+            headers = {**headers, **self.page_cache.conditional_headers(url)}
+        start = time.perf_counter()
+        with request_timings() as timings:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        # elapsed runs until the headers are in and includes opening a new connection; the body is read after
+        download = time.perf_counter() - start - response.elapsed.total_seconds()
+        for stage, seconds in timings.items():
+            self.metrics.observe(stage, seconds)
+        self.metrics.observe("ttfb", max(0.0, response.elapsed.total_seconds() - sum(timings.values())))
+        self.metrics.observe("download", max(0.0, download))
+        response.raise_for_status()
+        return response
+
+    def fetch(self, url):
+        """Returns a Page for url, or None if it could not be fetched.
+
+        Raises RetryableError when trying again later might work.
+        """
+        host = parse_url(url).host
+        with _in_flight:
+            return self._fetch(url, host)
+
+    def _fetch(self, url, host):
+        start = time.perf_counter()
+        try:
+            response = self._get(url)
+        except Timeout as e:
+            self.metrics.request(host, "timeout")
+            raise RetryableError(f"Timeout occurred for URL: {url}") from e
+        except requests.ConnectionError as e:
+            self.metrics.request(host, "disconnect")
+            raise RetryableError(f"Connection error for URL: {url}: {e}") from e
+        except requests.HTTPError as e:
+            self.metrics.request(host, "status")
+            if e.response is not None and e.response.status_code in RETRYABLE_STATUS:
+                raise RetryableError(f"Error fetching {url}: {e}", e.response.headers.get("Retry-After")) from e
+            logger.error(f"Error fetching {url}: {e}")
+            return None
+        except requests.RequestException as e:
+            self.metrics.request(host, "other")
+            logger.error(f"Error fetching {url}: {e}")
+            return None
+        finally:
+            self.metrics.observe("fetch", time.perf_counter() - start)
+        self.metrics.request(host)
+
+        page = Page(response.content, response.encoding or "utf-8", response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"), None, None)
+        if self.page_cache:
+            digest = body_hash(page.body)
+            page = page._replace(digest=digest,
+                                 previous=self.page_cache.previous_record(url, response.status_code, digest))
+            if response.status_code == 304 and page.previous is None:
+                logger.error(f"Not modified response for {url} without a cached record")
+                return None
+        return page
+
+    def remember(self, url, page, record):
+        """Stores a freshly parsed page in the page cache, if there is one."""
+        if self.page_cache and page.previous is None:
+            self.page_cache.update(url, page.etag, page.last_modified, page.digest, record)
+
+    def _check(self, url):
+        page = self.fetch(url)
+        if page is None:
+            return None
+        if page.previous:
+            return page.previous
+        with self.metrics.timer("parse"):
+            record = extract_product(page.body.decode(page.encoding, errors="replace"), url)
+        self.remember(url, page, record)
+        return record
+
+    async def map(self, func, urls, consume=None):
+        """Runs func(url) for every url on the thread pool, within the global and per-host limits.
+
+        When func raises RetryableError the url waits out its backoff without holding
+        a slot and is tried again, up to self.retries times; after that its result is
+        None. consume(index, url, result) is awaited while the limits are still held,
+        so a slow consumer holds back further fetches.
+        """
+        loop = asyncio.get_running_loop()
+        global_limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits = {}
+
+        async def run_one(index, url):
+            host = parse_url(url).host
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+            delay = 0
+            for attempt in range(self.retries + 1):
+                if delay:
+                    await asyncio.sleep(delay)
+                await self.rate_limiter.acquire(host)
+                async with host_limits[host], global_limit:
+                    try:
+                        result = await loop.run_in_executor(executor, func, url)
+                    except RetryableError as e:
+                        self.rate_limiter.failure(host)
+                        if attempt < self.retries:
+                            delay = backoff_delay(attempt, e.retry_after)
+                            self.retried += 1
+                            logger.info(f"{e}; retry {attempt + 1} in {delay:.1f}s")
+                            continue
+                        logger.warning(f"{e}; giving up after {attempt + 1} attempts")
+                        self.gave_up += 1
+                        result = None
+                    else:
+                        self.rate_limiter.success(host)
+                    if consume:
+                        await consume(index, url, result)
+                    return
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            await asyncio.gather(*(run_one(index, url) for index, url in enumerate(urls)))
+
+    async def run(self, urls, progress=None):
+        results = [None] * len(urls)
+        done = 0
+
+        async def collect(index, url, result):
+            nonlocal done
+            results[index] = result
+            done += 1
+            if progress:
+                progress(done, len(urls))
+
+        await self.map(self._check, urls, collect)
+        return results
+
+
+def check_availability_many(urls, max_concurrency=MAX_CONCURRENCY, per_host_limit=PER_HOST_LIMIT,
+                            timeout=TIMEOUT_SECONDS, progress=None, page_cache=None, retries=RETRIES, metrics=None):
+    """Checks all urls concurrently.
+
+    Returns one entry per url, in the same order: the 7-tuple record, or None when
+    the page could not be fetched or had no product title. With a page_cache,
+    unchanged pages are not parsed again and new validators are saved afterwards.
+    Timings and errors are added to metrics, a metrics.RunMetrics, if given.
+    """
+    urls = list(urls)
+    if page_cache:
+        page_cache.load(urls)
+    engine = FetchEngine(max_concurrency, per_host_limit, timeout, page_cache=page_cache, retries=retries,
+                         metrics=metrics)
+    results = asyncio.run(engine.run(urls, progress))
+    if page_cache:
+        page_cache.save()
+    return results
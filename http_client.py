@@ -0,0 +1,178 @@
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+logger = logging.getLogger(__name__)
+
+# Constants
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+POOL_CONNECTIONS = 16   # number of hosts to keep a pool for
+POOL_MAXSIZE = 16       # keep-alive connections kept per host
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"checkouts": 0, "misses": 0}
+_timings = threading.local()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+@contextmanager
+def request_timings():
+    """Collects the dns, connect and tls seconds of connections opened by this thread's requests.
+
+        with request_timings() as timings:
+            session.get(url)
+        timings.get("connect")      # None when a pooled connection was reused
+    """
+    _timings.current = timings = {}
+    try:
+        yield timings
+    finally:
+        _timings.current = None
+
+
+def _add_timing(stage, seconds):
+    timings = getattr(_timings, "current", None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        # Resolves once, then connects to the resolved addresses in order like create_connection
+        # does; TLS still verifies against self.host
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except OSError:
+            # Let urllib3 look up the name again and raise its own NameResolutionError
+            addresses = None
+        resolved = time.perf_counter()
+        _add_timing("dns", resolved - start)
+        if not addresses:
+            return super()._new_conn()
+
+        host = self._dns_host
+        try:
+            for index, address in enumerate(addresses):
+                self._dns_host = address[4][0]
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError):
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+            _add_timing("connect", time.perf_counter() - resolved)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        # connect() opens the socket through _new_conn, then does the TLS handshake
+        start = time.perf_counter()
+        timings = getattr(_timings, "current", None)
+        if timings is None:
+            timings = {}
+        before = timings.get("dns", 0.0) + timings.get("connect", 0.0)
+        super().connect()
+        opened = timings.get("dns", 0.0) + timings.get("connect", 0.0) - before
+        _add_timing("tls", max(0.0, time.perf_counter() - start - opened))
+
+
+class _CountingPoolMixin:
+    # Every request checks a connection out of the pool; a miss is one that had to be opened
+    def _get_conn(self, timeout=None):
+        _count("checkouts")
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        _count("misses")
+        return super()._new_conn()
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, **kwargs):
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def get_session():
+    """Returns the process-wide session; its keep-alive pools live for the whole run."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = PooledAdapter()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def pool_stats():
+    with _stats_lock:
+        checkouts, misses = _stats["checkouts"], _stats["misses"]
+    hits = max(checkouts - misses, 0)
+    return {
+        "requests": checkouts,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / checkouts if checkouts else 0.0,
+    }
+
+
+def reset_pool_stats():
+    with _stats_lock:
+        _stats["checkouts"] = 0
+        _stats["misses"] = 0
+
+
+def log_pool_stats(log=logger):
+    stats = pool_stats()
+    log.info(
+        f"Connection pool: {stats['requests']} requests, {stats['hits']} reused, "
+        f"{stats['misses']} new connections ({stats['hit_rate']:.0%} hit rate)"
+    )
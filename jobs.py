@@ -0,0 +1,244 @@
+"""Durable job queue in Sharkninja.db.
+
+Jobs are rows in the Jobs table, so they survive restarts and can be submitted
+from any process: the worker daemon's own schedule, the dashboard's Check Stock
+button or the command line. Workers claim jobs inside a BEGIN IMMEDIATE
+transaction, so two workers never take the same job, and at most one job per
+group (e.g. "NLShark") runs at a time.
+"""
+import json
+import logging
+from datetime import datetime, timedelta
+
+from db import reader, writer
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5 * 60        # seconds before a failed job runs again, doubled per attempt
+STALE_SECONDS = 10 * 60     # running jobs without a heartbeat for this long are requeued
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _now():
+    return datetime.now().strftime(DATE_FORMAT)
+
+
+def _job(job):
+    if job is None:
+        return None
+    job["Payload"] = json.loads(job["Payload"]) if job["Payload"] else {}
+    job["Result"] = json.loads(job["Result"]) if job["Result"] else None
+    return job
+
+
+def submit(kind, payload=None, group=None, priority=0, db_name=DB_NAME):
+    """Queues a job and returns its ID.
+
+    If the same kind of job for the same group is already queued, that job's ID
+    is returned instead, raised to priority if that is higher. The payloads are
+    merged; a full sweep ({"all": True}) stays one when a due-only submit lands on it.
+    """
+    with writer(db_name) as conn:
+        row = conn.execute("""
+            SELECT JobID, Payload FROM Jobs
+            WHERE Kind = ? AND GroupKey IS ? AND Status = ?
+            ORDER BY JobID LIMIT 1
+        """, (kind, group, QUEUED)).fetchone()
+        if row:
+            queued = json.loads(row[1]) if row[1] else {}
+            merged = {**queued, **(payload or {})}
+            if queued.get("all") or (payload or {}).get("all"):
+                merged["all"] = True
+            conn.execute("UPDATE Jobs SET Priority = MAX(Priority, ?), Payload = ? WHERE JobID = ?",
+                         (priority, json.dumps(merged), row[0]))
+            return row[0]
+        now = _now()
+        cursor = conn.execute("""
+            INSERT INTO Jobs (Kind, GroupKey, Payload, Status, Priority, CreatedAt, RunAfter, Attempts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+        """, (kind, group, json.dumps(payload or {}), QUEUED, priority, now, now))
+        logger.info(f"Queued {kind} job {cursor.lastrowid} for {group}")
+        return cursor.lastrowid
+
+
+def claim(worker_name, db_name=DB_NAME):
+    """Marks the next runnable job as running for worker_name and returns it, or None."""
+    now = _now()
+    with writer(db_name) as conn:
+        row = conn.execute("""
+            SELECT JobID FROM Jobs j
+            WHERE Status = ? AND RunAfter <= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM Jobs r WHERE r.Status = ? AND r.GroupKey = j.GroupKey
+            )
+            ORDER BY Priority DESC, JobID
+            LIMIT 1
+        """, (QUEUED, now, RUNNING)).fetchone()
+        if row is None:
+            return None
+        conn.execute("""
+            UPDATE Jobs SET Status = ?, Worker = ?, StartedAt = ?, HeartbeatAt = ?, Attempts = Attempts + 1,
+                            Progress = 0, Total = NULL, Error = NULL
+            WHERE JobID = ?
+        """, (RUNNING, worker_name, now, now, row[0]))
+    return get_job(row[0], db_name)
+
+
+def update_progress(job_id, done, total, db_name=DB_NAME):
+    """Records progress; also serves as the job's heartbeat."""
+    with writer(db_name) as conn:
+        conn.execute("UPDATE Jobs SET Progress = ?, Total = ?, HeartbeatAt = ? WHERE JobID = ?",
+                     (done, total, _now(), job_id))
+
+
+def heartbeat(job_ids, db_name=DB_NAME):
+    if not job_ids:
+        return
+    with writer(db_name) as conn:
+        now = _now()
+        conn.executemany("UPDATE Jobs SET HeartbeatAt = ? WHERE JobID = ?", [(now, job_id) for job_id in job_ids])
+
+
+def finish(job_id, result=None, db_name=DB_NAME):
+    with writer(db_name) as conn:
+        conn.execute("UPDATE Jobs SET Status = ?, FinishedAt = ?, Result = ? WHERE JobID = ?",
+                     (DONE, _now(), json.dumps(result), job_id))
+
+
+def fail(job_id, error, db_name=DB_NAME):
+    """Requeues the job with a growing delay, or marks it failed after MAX_ATTEMPTS."""
+    with writer(db_name) as conn:
+        attempts = conn.execute("SELECT Attempts FROM Jobs WHERE JobID = ?", (job_id,)).fetchone()[0]
+        if attempts < MAX_ATTEMPTS:
+            run_after = datetime.now() + timedelta(seconds=RETRY_DELAY * 2 ** (attempts - 1))
+            conn.execute("UPDATE Jobs SET Status = ?, RunAfter = ?, Error = ?, Worker = NULL WHERE JobID = ?",
+                         (QUEUED, run_after.strftime(DATE_FORMAT), error, job_id))
+            logger.warning(f"Job {job_id} failed (attempt {attempts}), retrying after {run_after:%H:%M}: {error}")
+        else:
+            conn.execute("UPDATE Jobs SET Status = ?, FinishedAt = ?, Error = ? WHERE JobID = ?",
+                         (FAILED, _now(), error, job_id))
+            logger.error(f"Job {job_id} failed after {attempts} attempts: {error}")
+
+
+def requeue(job_ids, db_name=DB_NAME):
+    """Puts running jobs back in the queue, e.g. when their worker is stopped; the attempt isn't counted."""
+    if not job_ids:
+        return 0
+    with writer(db_name) as conn:
+        cursor = conn.executemany("""
+            UPDATE Jobs SET Status = ?, Worker = NULL, Attempts = MAX(Attempts - 1, 0)
+            WHERE JobID = ? AND Status = ?
+        """, [(QUEUED, job_id, RUNNING) for job_id in job_ids])
+    logger.warning(f"Requeued {cursor.rowcount} unfinished jobs: {', '.join(map(str, job_ids))}")
+    return cursor.rowcount
+
+
+def requeue_stale(db_name=DB_NAME, stale_seconds=STALE_SECONDS):
+    """Puts running jobs whose worker stopped sending heartbeats back in the queue."""
+    cutoff = (datetime.now() - timedelta(seconds=stale_seconds)).strftime(DATE_FORMAT)
+    with writer(db_name) as conn:
+        cursor = conn.execute("UPDATE Jobs SET Status = ?, Worker = NULL WHERE Status = ? AND HeartbeatAt < ?",
+                              (QUEUED, RUNNING, cutoff))
+    if cursor.rowcount:
+        logger.warning(f"Requeued {cursor.rowcount} jobs without a heartbeat since {cutoff}")
+    return cursor.rowcount
+
+
+def get_job(job_id, db_name=DB_NAME):
+    with reader(db_name) as conn:
+        cursor = conn.execute("SELECT * FROM Jobs WHERE JobID = ?", (job_id,))
+        columns = [c[0] for c in cursor.description]
+        row = cursor.fetchone()
+    return _job(dict(zip(columns, row)) if row else None)
+
+
+def latest_job(kind, group, db_name=DB_NAME):
+    """Returns the most recent job of kind for group, or None."""
+    with reader(db_name) as conn:
+        cursor = conn.execute("SELECT * FROM Jobs WHERE Kind = ? AND GroupKey = ? ORDER BY JobID DESC LIMIT 1",
+                              (kind, group))
+        columns = [c[0] for c in cursor.description]
+        row = cursor.fetchone()
+    return _job(dict(zip(columns, row)) if row else None)
+
+
+# Cron-like schedules: "minute hour day month weekday", with *, */n, a-b and lists; weekday 0 is Sunday.
+# As in cron, when both day and weekday are restricted a date matches if either of them does
+
+def _cron_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = map(int, part.split("-"))
+        else:
+            start = end = int(part)
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def cron_next(expression, after):
+    """Returns the first minute after `after` that matches the cron expression."""
+    minute, hour, day, month, weekday = expression.split()
+    minutes = _cron_field(minute, 0, 59)
+    hours = _cron_field(hour, 0, 23)
+    days = _cron_field(day, 1, 31)
+    months = _cron_field(month, 1, 12)
+    weekdays = {d % 7 for d in _cron_field(weekday, 0, 7)}
+    # A field starting with * (also */n) doesn't restrict the day
+    either = not day.startswith("*") and not weekday.startswith("*")
+
+    def day_matches(t):
+        in_days = t.day in days
+        in_weekdays = (t.isoweekday() % 7) in weekdays
+        return in_days or in_weekdays if either else in_days and in_weekdays
+
+    t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = t + timedelta(days=366)
+    while t < limit:
+        if t.month not in months:
+            t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+        elif not day_matches(t):
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+        elif t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+        elif t.minute not in minutes:
+            t += timedelta(minutes=1)
+        else:
+            return t
+    raise ValueError(f"Cron expression never matches: {expression}")
+
+
+def ensure_schedule(name, kind, group, cron, payload=None, db_name=DB_NAME):
+    """Adds a schedule if it doesn't exist yet; existing schedules keep their (possibly edited) cron."""
+    with writer(db_name) as conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO JobSchedules (Name, Kind, GroupKey, Payload, Cron, NextRun)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, kind, group, json.dumps(payload or {}), cron, _now()))
+
+
+def submit_due_schedules(db_name=DB_NAME):
+    """Queues a job for every schedule whose time has come and moves it to its next run."""
+    now = datetime.now()
+    with reader(db_name) as conn:
+        due = conn.execute("""
+            SELECT Name, Kind, GroupKey, Payload, Cron FROM JobSchedules WHERE NextRun <= ?
+        """, (now.strftime(DATE_FORMAT),)).fetchall()
+    for name, kind, group, payload, cron in due:
+        submit(kind, json.loads(payload) if payload else None, group, db_name=db_name)
+        with writer(db_name) as conn:
+            conn.execute("UPDATE JobSchedules SET NextRun = ?, LastRun = ? WHERE Name = ?",
+                         (cron_next(cron, now).strftime(DATE_FORMAT), now.strftime(DATE_FORMAT), name))
+    return len(due)
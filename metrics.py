@@ -0,0 +1,309 @@
+"""Run-level metrics of the scraper sweeps.
+
+Every sweep (scheduledstart.check_stock, the worker's sweeps and
+sharded_sweep) fills one RunMetrics:
+- a latency histogram per stage: dns, connect and tls for new connections,
+  ttfb and download per request, fetch for the whole attempt, parse per page
+  and db_write per saved batch
+- requests and errors per host, by kind (timeout, disconnect, status, other)
+- the URLs checked and skipped
+
+save_run() writes the summary to ScrapeRuns, with one ScrapeRunHosts row per
+host, and adds the run to the totals of this process. serve() exposes those
+totals in the Prometheus text format:
+
+    python worker.py --metrics-port 9108     # then GET http://localhost:9108/metrics
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from data_versions import RUNS, bump_version
+from db import writer
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]     # seconds
+STAGES = ["dns", "connect", "tls", "ttfb", "download", "fetch", "parse", "db_write"]
+ERROR_KINDS = ["timeout", "disconnect", "status", "other"]
+PREFIX = "sharkninja_scraper"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class Histogram:
+    """Counts of observations per bucket (the last one is everything above BUCKETS), with their sum."""
+
+    def __init__(self, counts=None, total=0.0):
+        self.counts = list(counts) if counts else [0] * (len(BUCKETS) + 1)
+        self.total = total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, seconds):
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            index = len(BUCKETS)
+        self.counts[index] += 1
+        self.total += seconds
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def quantile(self, q):
+        """Estimates the q-quantile by interpolating within its bucket; None without observations."""
+        count = self.count
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+    def to_dict(self):
+        return {"counts": self.counts, "sum": round(self.total, 6)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["counts"], data["sum"])
+
+
+class RunMetrics:
+    """Metrics of one sweep; safe to update from the fetch threads.
+
+    Plain data, so a shard process can send its metrics to the parent, which
+    merges them into its own.
+    """
+
+    def __init__(self, kind, group_key=None):
+        self.kind = kind
+        self.group_key = group_key
+        self.started_at = datetime.now().strftime(DATE_FORMAT)
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.urls = 0
+        self.checked = 0
+        self.skipped = 0
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.hosts = {}         # host: {"urls": n, "requests": n, "skipped": n, kind: n for ERROR_KINDS}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = dict.fromkeys(["urls", "requests", "skipped"] + ERROR_KINDS, 0)
+        return self.hosts[host]
+
+    def request(self, host, error=None):
+        """Counts one fetch attempt for host; error is one of ERROR_KINDS, or None when it worked."""
+        with self._lock:
+            counts = self._host(host)
+            counts["requests"] += 1
+            if error:
+                counts[error] += 1
+
+    def checked_urls(self, results, host_of):
+        """Counts a batch of results, {url: record or None}; host_of(url) gives the URL's host."""
+        with self._lock:
+            for url, record in results.items():
+                counts = self._host(host_of(url))
+                self.urls += 1
+                counts["urls"] += 1
+                if record is None:
+                    self.skipped += 1
+                    counts["skipped"] += 1
+                else:
+                    self.checked += 1
+
+    def merge(self, other):
+        with self._lock:
+            for stage, histogram in other.stages.items():
+                self.stages[stage].merge(histogram)
+            for host, counts in other.hosts.items():
+                own = self._host(host)
+                for key, count in counts.items():
+                    own[key] += count
+            self.urls += other.urls
+            self.checked += other.checked
+            self.skipped += other.skipped
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+        return self
+
+    @property
+    def errors(self):
+        return sum(counts[kind] for counts in self.hosts.values() for kind in ERROR_KINDS)
+
+    def summary(self):
+        fetch = self.stages["fetch"]
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.start
+        return {
+            "kind": self.kind,
+            "group": self.group_key,
+            "seconds": round(seconds, 3),
+            "urls": self.urls,
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "urls_per_second": round(self.urls / seconds, 2) if seconds else 0.0,
+            "fetch_p50": fetch.quantile(0.5),
+            "fetch_p95": fetch.quantile(0.95),
+            "db_write_seconds": round(self.stages["db_write"].total, 3),
+        }
+
+    def log(self, log=logger):
+        s = self.summary()
+        log.info(f"Run {self.kind} {self.group_key or ''}: {s['urls']} URLs in {s['seconds']:.1f}s "
+                 f"({s['urls_per_second']:.1f}/sec), {s['skipped']} skipped, {s['errors']} failed attempts, "
+                 f"db writes {s['db_write_seconds']:.1f}s")
+        for stage, histogram in self.stages.items():
+            if histogram.count:
+                log.info(f"  {stage}: {histogram.count} x, p50 {histogram.quantile(0.5) * 1000:.0f} ms, "
+                         f"p95 {histogram.quantile(0.95) * 1000:.0f} ms, total {histogram.total:.1f}s")
+        for host, counts in sorted(self.hosts.items()):
+            errors = ", ".join(f"{counts[kind]} {kind}" for kind in ERROR_KINDS if counts[kind])
+            log.info(f"  {host}: {counts['urls']} URLs, {counts['requests']} requests, {counts['skipped']} skipped"
+                     + (f", {errors}" if errors else ""))
+
+
+def save_run(run, db_name=DB_NAME):
+    """Writes a finished run to ScrapeRuns and ScrapeRunHosts and adds it to the process totals."""
+    if run.seconds is None:
+        run.finish()
+    s = run.summary()
+    details = json.dumps({"stages": {stage: histogram.to_dict() for stage, histogram in run.stages.items()}})
+    try:
+        with writer(db_name) as conn:
+            run_id = conn.execute("""
+                INSERT INTO ScrapeRuns
+                (Kind, GroupKey, StartedAt, FinishedAt, Seconds, URLs, Checked, Skipped, Errors,
+                 FetchP50, FetchP95, DbWriteSeconds, Stages)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (run.kind, run.group_key, run.started_at, datetime.now().strftime(DATE_FORMAT), s["seconds"],
+                  s["urls"], s["checked"], s["skipped"], s["errors"], s["fetch_p50"], s["fetch_p95"],
+                  s["db_write_seconds"], details)).lastrowid
+            conn.executemany("""
+                INSERT INTO ScrapeRunHosts
+                (RunID, Host, URLs, Requests, Skipped, Timeouts, Disconnects, StatusErrors, OtherErrors)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(run_id, host, c["urls"], c["requests"], c["skipped"], c["timeout"], c["disconnect"], c["status"],
+                   c["other"]) for host, c in run.hosts.items()])
+            bump_version(conn, RUNS)
+    except Exception as e:
+        # Metrics must never fail a sweep
+        logger.error(f"Could not save the metrics of run {run.kind}: {e}")
+        run_id = None
+    _totals.add(run)
+    run.log()
+    return run_id
+
+
+class _Totals:
+    # Everything this process has measured, for the Prometheus endpoint
+    def __init__(self):
+        self.metrics = RunMetrics("total")
+        self.runs = {}          # kind: (runs, seconds)
+
+    def add(self, run):
+        self.metrics.merge(run)
+        with self.metrics._lock:
+            runs, seconds = self.runs.get(run.kind, (0, 0.0))
+            self.runs[run.kind] = (runs + 1, seconds + run.seconds)
+
+    def prometheus(self):
+        lines = []
+        with self.metrics._lock:
+            lines.append(f"# TYPE {PREFIX}_stage_seconds histogram")
+            for stage, histogram in self.metrics.stages.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+            lines.append(f"# TYPE {PREFIX}_host_requests_total counter")
+            for host, counts in sorted(self.metrics.hosts.items()):
+                lines.append(f'{PREFIX}_host_requests_total{{host="{host}"}} {counts["requests"]}')
+            lines.append(f"# TYPE {PREFIX}_host_errors_total counter")
+            for host, counts in sorted(self.metrics.hosts.items()):
+                for kind in ERROR_KINDS:
+                    lines.append(f'{PREFIX}_host_errors_total{{host="{host}",kind="{kind}"}} {counts[kind]}')
+            lines.append(f"# TYPE {PREFIX}_host_skipped_urls_total counter")
+            for host, counts in sorted(self.metrics.hosts.items()):
+                lines.append(f'{PREFIX}_host_skipped_urls_total{{host="{host}"}} {counts["skipped"]}')
+            lines.append(f"# TYPE {PREFIX}_runs_total counter")
+            for kind, (runs, _) in sorted(self.runs.items()):
+                lines.append(f'{PREFIX}_runs_total{{kind="{kind}"}} {runs}')
+            lines.append(f"# TYPE {PREFIX}_run_seconds_total counter")
+            for kind, (_, seconds) in sorted(self.runs.items()):
+                lines.append(f'{PREFIX}_run_seconds_total{{kind="{kind}"}} {seconds:.3f}')
+            lines.append(f"# TYPE {PREFIX}_urls_total counter")
+            lines.append(f'{PREFIX}_urls_total{{result="checked"}} {self.metrics.checked}')
+            lines.append(f'{PREFIX}_urls_total{{result="skipped"}} {self.metrics.skipped}')
+        return "\n".join(lines) + "\n"
+
+
+_totals = _Totals()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = _totals.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """Serves the totals of this process at http://host:port/metrics from a background thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
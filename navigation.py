@@ -23,6 +23,7 @@ def make_sidebar():
             st.page_link("pages/page1.py", label="Dashboard")
             st.page_link("pages/page2.py", label="Price Tracking")
             st.page_link("pages/add_urls.py", label="Urls")
+            st.page_link("pages/performance.py", label="Scraper Performance")
 
             st.write("")
             st.write("")
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime
+
+from db import reader, writer
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+CHUNK_SIZE = 500    # URLs per IN (...) lookup
+
+
+def body_hash(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class PageCache:
+    """ETag, Last-Modified, body hash and last parsed record of every product page.
+
+    The fetcher sends If-None-Match / If-Modified-Since for pages it has seen
+    before. When the server answers 304, or the body hashes the same as last
+    time, the previous record is carried forward with a new date and the page is
+    not parsed again. New and changed pages are written back by save().
+    """
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self._entries = {}      # url: (etag, last_modified, hash, record)
+        self._updates = {}
+        self._lock = threading.Lock()
+        self.not_modified = 0   # 304 responses
+        self.same_hash = 0      # 200 responses with the body we already had
+        self.parsed = 0
+
+    def load(self, urls):
+        urls = [url for url in dict.fromkeys(urls) if url not in self._entries]
+        with reader(self.db_name) as conn:
+            for start in range(0, len(urls), CHUNK_SIZE):
+                chunk = urls[start:start + CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                for url, etag, last_modified, digest, record in conn.execute(
+                    f"SELECT URL, ETag, LastModified, BodyHash, Record FROM PageCache WHERE URL IN ({placeholders})", chunk
+                ):
+                    self._entries[url] = (etag, last_modified, digest, tuple(json.loads(record)))
+
+    def conditional_headers(self, url):
+        entry = self._entries.get(url)
+        if entry is None:
+            return {}
+        etag, last_modified, _, _ = entry
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def previous_record(self, url, status_code, digest):
+        """Returns the last record for url, re-dated to now, if the page did not change; otherwise None."""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        with self._lock:
+            if status_code == 304:
+                self.not_modified += 1
+            elif digest == entry[2]:
+                self.same_hash += 1
+            else:
+                return None
+        record = entry[3]
+        return record[:2] + (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),) + record[3:]
+
+    def update(self, url, etag, last_modified, digest, record):
+        """Remembers a freshly parsed page; pages without a product record are not cached."""
+        with self._lock:
+            self.parsed += 1
+            if record is None:
+                return
+            self._entries[url] = (etag, last_modified, digest, tuple(record))
+            self._updates[url] = self._entries[url]
+
+    def take_updates(self):
+        """Returns the pages parsed since the last save and forgets them, for another process to save."""
+        with self._lock:
+            updates, self._updates = self._updates, {}
+        return updates
+
+    def save(self, updates=None):
+        if updates is None:
+            updates = self.take_updates()
+        if not updates:
+            return
+        fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with writer(self.db_name) as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO PageCache (URL, ETag, LastModified, BodyHash, Record, FetchedAt)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(url, etag, last_modified, digest, json.dumps(record), fetched_at)
+                  for url, (etag, last_modified, digest, record) in updates.items()])
+
+    @property
+    def skipped(self):
+        return self.not_modified + self.same_hash
+
+    def log_stats(self, log=logger):
+        log.info(f"Pages skipped as unchanged: {self.skipped} ({self.not_modified} not modified, "
+                 f"{self.same_hash} same content), {self.parsed} parsed")
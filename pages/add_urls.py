@@ -1,64 +1,42 @@
 import streamlit as st
 import sqlite3
 from navigation import make_sidebar
+from data_versions import DIMENSIONS, bump_version
+from schema import migrate
+from db import reader, writer
+from url_info import add_url
 import pandas as pd
 make_sidebar()
 
 def setup_database(db_name="Sharkninja.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS urls (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        url TEXT UNIQUE
-    )
-    ''')
-    conn.commit()
-    conn.close()
+    migrate(db_name)
 
 def add_url_to_database(url, db_name="Sharkninja.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute("INSERT INTO urls (url) VALUES (?)", (url,))
-        conn.commit()
+        with writer(db_name) as conn:
+            add_url(conn, url)
+            bump_version(conn, DIMENSIONS)
         return True
     except sqlite3.IntegrityError:
         # URL already exists
         return False
-    finally:
-        conn.close()
 
 def get_all_urls_from_database(db_name="Sharkninja.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT url FROM urls")
-    urls = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
+    with reader(db_name) as conn:
+        urls = [row[0] for row in conn.execute("SELECT url FROM urls").fetchall()]
     return urls
 
 def search_urls(search_term, db_name="Sharkninja.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT url FROM urls WHERE url LIKE ?", (f'%{search_term}%',))
-    urls = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
+    with reader(db_name) as conn:
+        urls = [row[0] for row in conn.execute("SELECT url FROM urls WHERE url LIKE ?", (f'%{search_term}%',)).fetchall()]
     return urls
 
 def remove_url_from_database(url, db_name="Sharkninja.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM urls WHERE url = ?", (url,))
-    conn.commit()
-    
-    removed = cursor.rowcount > 0
-    conn.close()
+    with writer(db_name) as conn:
+        removed = conn.execute("DELETE FROM urls WHERE url = ?", (url,)).rowcount > 0
+        if removed:
+            # Scrapers may have cached this URL's id
+            bump_version(conn, DIMENSIONS)
     return removed
 
 def main():
@@ -1,54 +1,58 @@
 from navigation import make_sidebar
+from data_versions import DIMENSIONS, PRICES, STOCK, bump_version, current_versions
+from queries import PRICE_HISTORY
+from schema import migrate
+from db import reader, writer
+from exports import export_filename, export_prices, mime_type
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
 from datetime import date, datetime
-import io
+import os
 
 st.set_page_config(layout="wide", page_title="SKU Price Manager")
 make_sidebar()
 
+CACHE_TTL = 15 * 60     # seconds
+
 class PriceManager:
     def __init__(self, db_name='Sharkninja.db'):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+        migrate(db_name)
+        self.db_name = db_name
 
     def upsert_price(self, sku, price, entry_date, reason, country):
-        # Get ProductID and CountryID
-        self.cursor.execute("SELECT ProductID FROM Products WHERE SKU = ?", (sku,))
-        product_id = self.cursor.fetchone()
-        if not product_id:
-            self.cursor.execute("INSERT INTO Products (SKU, ProductName) VALUES (?, ?)", (sku, f"Product {sku}"))
-            product_id = self.cursor.lastrowid
-        else:
-            product_id = product_id[0]
-
-        self.cursor.execute("SELECT CountryID FROM Countries WHERE CountryCode = ?", (country,))
-        country_id = self.cursor.fetchone()
-        if not country_id:
-            self.cursor.execute("INSERT INTO Countries (CountryCode) VALUES (?)", (country,))
-            country_id = self.cursor.lastrowid
-        else:
-            country_id = country_id[0]
-
-        # Insert or update price
-        self.cursor.execute('''
-            INSERT INTO Prices (ProductID, CountryID, Price, EntryDate, Reason) 
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(ProductID, CountryID, EntryDate) 
-            DO UPDATE SET Price = ?, Reason = ?
-        ''', (product_id, country_id, price, entry_date, reason, price, reason))
-        self.conn.commit()
+        with writer(self.db_name) as conn:
+            cursor = conn.cursor()
+            # Get ProductID and CountryID
+            cursor.execute("SELECT ProductID FROM Products WHERE SKU = ?", (sku,))
+            product_id = cursor.fetchone()
+            if not product_id:
+                cursor.execute("INSERT INTO Products (SKU, ProductName) VALUES (?, ?)", (sku, f"Product {sku}"))
+                product_id = cursor.lastrowid
+                bump_version(conn, DIMENSIONS)
+            else:
+                product_id = product_id[0]
+
+            cursor.execute("SELECT CountryID FROM Countries WHERE CountryCode = ?", (country,))
+            country_id = cursor.fetchone()
+            if not country_id:
+                cursor.execute("INSERT INTO Countries (CountryCode) VALUES (?)", (country,))
+                country_id = cursor.lastrowid
+                bump_version(conn, DIMENSIONS)
+            else:
+                country_id = country_id[0]
+
+            # Insert or update price
+            cursor.execute('''
+                INSERT INTO Prices (ProductID, CountryID, Price, EntryDate, Reason) 
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(ProductID, CountryID, EntryDate) 
+                DO UPDATE SET Price = ?, Reason = ?
+            ''', (product_id, country_id, price, entry_date, reason, price, reason))
+            bump_version(conn, PRICES)
 
     def get_price_history(self, sku, country=None, days=None):
-        query = '''
-            SELECT p.EntryDate, p.Price, p.Reason, c.CountryCode as country 
-            FROM Prices p
-            JOIN Products pr ON p.ProductID = pr.ProductID
-            JOIN Countries c ON p.CountryID = c.CountryID
-            WHERE pr.SKU = ?
-        '''
+        query = PRICE_HISTORY
         params = [sku]
         if country:
             query += " AND c.CountryCode = ?"
@@ -56,34 +60,29 @@ class PriceManager:
         if days:
             query += f" AND p.EntryDate >= date('now', '-{days} days')"
         query += " ORDER BY p.EntryDate DESC"
-        return pd.read_sql_query(query, self.conn, params=params)
+        with reader(self.db_name) as conn:
+            return pd.read_sql_query(query, conn, params=params)
 
     def delete_entry(self, sku, entry_date, country):
-        self.cursor.execute('''
-            DELETE FROM Prices 
-            WHERE ProductID = (SELECT ProductID FROM Products WHERE SKU = ?)
-            AND CountryID = (SELECT CountryID FROM Countries WHERE CountryCode = ?)
-            AND EntryDate = ?
-        ''', (sku, country, entry_date))
-        self.conn.commit()
-        return self.cursor.rowcount
+        with writer(self.db_name) as conn:
+            cursor = conn.execute('''
+                DELETE FROM Prices 
+                WHERE ProductID = (SELECT ProductID FROM Products WHERE SKU = ?)
+                AND CountryID = (SELECT CountryID FROM Countries WHERE CountryCode = ?)
+                AND EntryDate = ?
+            ''', (sku, country, entry_date))
+            if cursor.rowcount:
+                bump_version(conn, PRICES)
+        return cursor.rowcount
 
     def search_skus(self, term):
-        return pd.read_sql_query("SELECT DISTINCT SKU FROM Products WHERE SKU LIKE ?",
-                                 self.conn, params=(f'%{term}%',))['SKU'].tolist()
+        with reader(self.db_name) as conn:
+            return pd.read_sql_query("SELECT DISTINCT SKU FROM Products WHERE SKU LIKE ?",
+                                     conn, params=(f'%{term}%',))['SKU'].tolist()
 
-    def export_data(self):
-        query = '''
-            SELECT pr.SKU, p.Price, p.EntryDate, p.Reason, c.CountryCode as Country
-            FROM Prices p
-            JOIN Products pr ON p.ProductID = pr.ProductID
-            JOIN Countries c ON p.CountryID = c.CountryID
-        '''
-        df = pd.read_sql_query(query, self.conn)
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Prices')
-        return output.getvalue()
+    def export_data(self, fmt="xlsx"):
+        """Streams all prices to a temporary file and returns its path; the caller removes it."""
+        return export_prices(fmt, self.db_name)
 
     def get_price_changes_by_date(self, search_date, country):
         query = '''
@@ -93,7 +92,8 @@ class PriceManager:
             JOIN Countries c ON p.CountryID = c.CountryID
             WHERE p.EntryDate = ? AND c.CountryCode = ?
         '''
-        return pd.read_sql_query(query, self.conn, params=(search_date, country))
+        with reader(self.db_name) as conn:
+            return pd.read_sql_query(query, conn, params=(search_date, country))
 
     def add_logo():
         st.markdown(
@@ -114,8 +114,25 @@ class PriceManager:
 # Call add_logo function
 
 
+@st.cache_resource
+def get_price_manager():
+    return PriceManager()
+
+
+# Cached until the scrapers or this page write new data (version) or CACHE_TTL passes
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def search_skus(term, version=None):
+    return get_price_manager().search_skus(term)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_price_history(sku, country=None, days=None, version=None):
+    return get_price_manager().get_price_history(sku, country, days)
+
+
 def main():
-    pm = PriceManager()
+    pm = get_price_manager()
+    version = current_versions([DIMENSIONS, STOCK, PRICES])
 
     st.title('SKU Price Manager')
 
@@ -123,13 +140,22 @@ def main():
 
     with col1:
         country = st.radio("Select Country:", ["NL", "BE", "FR"])
-        if st.button('Export to Excel'):
-            st.download_button(
-                label="Download Excel file",
-                data=pm.export_data(),
-                file_name="price_database.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        export_format = st.radio("Export format:", ["xlsx", "csv"], key="export_format",
+                                 format_func=lambda fmt: "Excel" if fmt == "xlsx" else "CSV (gzip)")
+        if st.button('Export to Excel' if export_format == "xlsx" else 'Export to CSV'):
+            # Written in chunks; the download button still holds the finished file in memory (see exports.py)
+            with st.spinner("Exporting..."):
+                path = pm.export_data(export_format)
+            try:
+                with open(path, "rb") as f:
+                    st.download_button(
+                        label="Download file",
+                        data=f,
+                        file_name=export_filename("price_database", export_format),
+                        mime=mime_type(export_format)
+                    )
+            finally:
+                os.remove(path)
 
     with col2:
         tab1, tab2, tab3, tab4 = st.tabs(
@@ -150,7 +176,7 @@ def main():
             if st.session_state.adding_new_sku:
                 sku = st.text_input('Enter new SKU:', key='new_sku_input')
             else:
-                sku = st.selectbox('Select SKU:', [''] + pm.search_skus(''), key='manage_sku')
+                sku = st.selectbox('Select SKU:', [''] + search_skus('', version), key='manage_sku')
         
             price = st.number_input('Price (€):', min_value=0.0, format='%.2f')
             reason = st.text_input('Reason for change:')
@@ -172,12 +198,12 @@ def main():
             col1, col2 = st.columns([1, 2])
 
             with col1:
-                lookup_sku = st.selectbox('Select or Enter SKU:', [''] + pm.search_skus(''), key='history_sku')
+                lookup_sku = st.selectbox('Select or Enter SKU:', [''] + search_skus('', version), key='history_sku')
                 show_all = st.checkbox("Show all countries")
 
             if lookup_sku:
-                df = pm.get_price_history(lookup_sku, None if show_all else country)
-                df_30_days = pm.get_price_history(lookup_sku, None if show_all else country, days=30)
+                df = get_price_history(lookup_sku, None if show_all else country, version=version)
+                df_30_days = get_price_history(lookup_sku, None if show_all else country, days=30, version=version)
 
                 if not df.empty:
                     with col2:
@@ -215,10 +241,10 @@ def main():
 
         with tab4:
             st.subheader("Delete Entries")
-            del_sku = st.selectbox('Select SKU:', [''] + pm.search_skus(''), key='delete_sku')
+            del_sku = st.selectbox('Select SKU:', [''] + search_skus('', version), key='delete_sku')
         
             if del_sku:
-                df = pm.get_price_history(del_sku, country)
+                df = get_price_history(del_sku, country, version=version)
                 if not df.empty:
                     st.write(f"Current entries for {del_sku} in {country}:")
         
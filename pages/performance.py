@@ -0,0 +1,151 @@
+from navigation import make_sidebar
+from data_versions import RUNS, current_versions
+from metrics import STAGES, Histogram
+from queries import HOST_HEALTH, RUN_STAGES, SCRAPE_RUNS
+from schema import migrate
+from db import reader
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from datetime import datetime, timedelta
+import json
+
+st.set_page_config(layout="wide", page_title="Scraper Performance")
+make_sidebar()
+
+DB_NAME = 'Sharkninja.db'
+CACHE_TTL = 15 * 60     # seconds
+DAY_OPTIONS = [1, 7, 30, 90]
+
+
+def since(days):
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Cached until a sweep saves its metrics (version) or CACHE_TTL passes
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_runs(days, version=None):
+    with reader(DB_NAME) as conn:
+        df = pd.read_sql_query(SCRAPE_RUNS, conn, params=(since(days),))
+    df['StartedAt'] = pd.to_datetime(df['StartedAt'])
+    df['URLsPerSecond'] = (df['URLs'] / df['Seconds']).where(df['Seconds'] > 0, 0.0)
+    return df
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_host_health(days, version=None):
+    with reader(DB_NAME) as conn:
+        df = pd.read_sql_query(HOST_HEALTH, conn, params=(since(days),))
+    df['SkipRate'] = (df['Skipped'] / df['URLs']).where(df['URLs'] > 0, 0.0)
+    df['TimeoutRate'] = (df['Timeouts'] / df['Requests']).where(df['Requests'] > 0, 0.0)
+    df['ErrorRate'] = ((df['Timeouts'] + df['Disconnects'] + df['StatusErrors'] + df['OtherErrors'])
+                       / df['Requests']).where(df['Requests'] > 0, 0.0)
+    return df.sort_values('ErrorRate', ascending=False)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_stage_latencies(days, kinds, version=None):
+    """p50/p95 per stage over every run in the window, from the histograms in ScrapeRuns.Stages."""
+    merged = {stage: Histogram() for stage in STAGES}
+    with reader(DB_NAME) as conn:
+        for kind, stages in conn.execute(RUN_STAGES, (since(days),)):
+            if kind not in kinds or not stages:
+                continue
+            for stage, data in json.loads(stages)["stages"].items():
+                if stage in merged:
+                    merged[stage].merge(Histogram.from_dict(data))
+    return pd.DataFrame([
+        {'Stage': stage, 'Count': histogram.count,
+         'p50 (ms)': histogram.quantile(0.5) * 1000, 'p95 (ms)': histogram.quantile(0.95) * 1000,
+         'Total (s)': histogram.total}
+        for stage, histogram in merged.items() if histogram.count
+    ])
+
+
+def main():
+    migrate(DB_NAME)
+    version = current_versions([RUNS], DB_NAME)
+
+    st.title('Scraper Performance')
+
+    days = st.radio("Period (days):", DAY_OPTIONS, index=1, horizontal=True)
+    runs = get_runs(days, version)
+    if runs.empty:
+        st.info(f"No sweeps recorded in the last {days} days")
+        return
+
+    all_kinds = sorted(runs['Kind'].unique())
+    kinds = st.multiselect("Sweeps:", all_kinds, default=all_kinds)
+    runs = runs[runs['Kind'].isin(kinds)]
+    if runs.empty:
+        st.info("Select at least one kind of sweep")
+        return
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Sweeps", len(runs))
+    col2.metric("Median duration", f"{runs['Seconds'].median():.0f}s")
+    col3.metric("URLs/sec", f"{runs['URLs'].sum() / runs['Seconds'].sum():.1f}" if runs['Seconds'].sum() else "-")
+    col4.metric("Skipped", f"{runs['Skipped'].sum() / runs['URLs'].sum():.1%}" if runs['URLs'].sum() else "-")
+    col5.metric("DB write time", f"{runs['DbWriteSeconds'].sum():.0f}s")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(
+            px.line(runs, x='StartedAt', y='Seconds', color='Kind', markers=True, title='Sweep duration')
+            .update_layout(yaxis_title='Seconds', xaxis_title='Started'),
+            use_container_width=True
+        )
+        fetch = runs.melt(id_vars=['StartedAt', 'Kind'], value_vars=['FetchP50', 'FetchP95'],
+                          var_name='Quantile', value_name='Latency')
+        fetch['Latency'] = fetch['Latency'] * 1000
+        fetch['Quantile'] = fetch['Quantile'].str.replace('Fetch', '').str.lower() + ' ' + fetch['Kind']
+        st.plotly_chart(
+            px.line(fetch, x='StartedAt', y='Latency', color='Quantile', markers=True, title='Fetch latency')
+            .update_layout(yaxis_title='Milliseconds', xaxis_title='Started'),
+            use_container_width=True
+        )
+    with col2:
+        st.plotly_chart(
+            px.line(runs, x='StartedAt', y='URLsPerSecond', color='Kind', markers=True, title='Throughput')
+            .update_layout(yaxis_title='URLs/sec', xaxis_title='Started'),
+            use_container_width=True
+        )
+        st.plotly_chart(
+            px.line(runs, x='StartedAt', y='DbWriteSeconds', color='Kind', markers=True, title='Database write time')
+            .update_layout(yaxis_title='Seconds', xaxis_title='Started'),
+            use_container_width=True
+        )
+
+    st.subheader("Host health")
+    hosts = get_host_health(days, version)
+    if hosts.empty:
+        st.info("No requests recorded")
+    else:
+        st.plotly_chart(
+            px.bar(hosts.melt(id_vars='Host', value_vars=['SkipRate', 'TimeoutRate'], var_name='Rate'),
+                   x='Host', y='value', color='Rate', barmode='group', title='Skip and timeout rate per host')
+            .update_layout(yaxis_title='Rate', xaxis_title='Host', yaxis_tickformat='.0%'),
+            use_container_width=True
+        )
+        st.dataframe(
+            hosts.style.format({'SkipRate': '{:.1%}', 'TimeoutRate': '{:.1%}', 'ErrorRate': '{:.1%}'}),
+            hide_index=True,
+            use_container_width=True
+        )
+
+    st.subheader("Stage latency")
+    stages = get_stage_latencies(days, tuple(kinds), version)
+    if not stages.empty:
+        st.dataframe(
+            stages.style.format({'p50 (ms)': '{:.0f}', 'p95 (ms)': '{:.0f}', 'Total (s)': '{:.1f}'}),
+            hide_index=True,
+            use_container_width=True
+        )
+
+    st.subheader("Recent sweeps")
+    st.dataframe(runs.sort_values('StartedAt', ascending=False).head(50), hide_index=True,
+                 use_container_width=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fetcher import MAX_CONCURRENCY, PER_HOST_LIMIT, RETRIES, TIMEOUT_SECONDS, FetchEngine
+from product_parser import extract_product
+
+logger = logging.getLogger(__name__)
+
+# Constants
+PARSE_WORKERS = os.cpu_count() or 1
+QUEUE_SIZE = 64     # fetched pages waiting for a parser before the fetchers are held back
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool(workers=PARSE_WORKERS):
+    """Returns the parser process pool, started once and reused by every sweep in this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def shutdown_parse_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _parse_page(body, encoding, url):
+    # Runs in a parser process
+    start = time.perf_counter()
+    record = extract_product(body.decode(encoding, errors="replace"), url)
+    return record, time.perf_counter() - start
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.failed = 0
+        self.bytes = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, start, end, failed=False, size=0, busy=None):
+        with self._lock:
+            self.items += 1
+            self.failed += failed
+            self.bytes += size
+            self.busy_seconds += end - start if busy is None else busy
+            self.first_start = start if self.first_start is None else min(self.first_start, start)
+            self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    @property
+    def throughput(self):
+        if not self.items or self.last_end == self.first_start:
+            return 0.0
+        return self.items / (self.last_end - self.first_start)
+
+    def summary(self):
+        return (
+            f"{self.name}: {self.items} items ({self.failed} failed), {self.throughput:.1f}/sec, "
+            f"{self.bytes / 1024 / 1024:.1f} MiB, busy {self.busy_seconds:.1f}s, waited {self.wait_seconds:.1f}s"
+        )
+
+
+class SweepPipeline:
+    """Fetch threads hand raw page bytes to a pool of parser processes through a bounded queue.
+
+    A fetcher keeps its connection slot until its page is on the queue, so when the
+    parsers fall behind the queue fills up and fetching pauses instead of piling up
+    pages in memory. Pages the page cache reports as unchanged skip the parsers.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, per_host_limit=PER_HOST_LIMIT,
+                 timeout=TIMEOUT_SECONDS, parse_workers=PARSE_WORKERS, queue_size=QUEUE_SIZE, page_cache=None,
+                 retries=RETRIES, metrics=None):
+        self.engine = FetchEngine(max_concurrency, per_host_limit, timeout, page_cache=page_cache, retries=retries,
+                                  metrics=metrics)
+        self.metrics = self.engine.metrics
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.fetch_stats = StageStats("fetch")
+        self.parse_stats = StageStats("parse")
+        self.max_queue_depth = 0
+
+    def _fetch(self, url):
+        start = time.perf_counter()
+        page = None
+        try:
+            page = self.engine.fetch(url)
+        finally:
+            self.fetch_stats.record(start, time.perf_counter(), page is None, len(page.body) if page else 0)
+        return page
+
+    async def run(self, urls, progress=None, on_result=None):
+        """Returns the record of every URL, None where it couldn't be checked.
+
+        on_result(url, record) is called as soon as a URL is done, in completion order.
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_parse_pool(self.parse_workers)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        results = [None] * len(urls)
+        done = 0
+
+        def finish(index):
+            nonlocal done
+            done += 1
+            if on_result:
+                on_result(urls[index], results[index])
+            if progress:
+                progress(done, len(urls))
+
+        async def enqueue(index, url, page):
+            if page is None or page.previous:
+                if page:
+                    results[index] = page.previous
+                finish(index)
+                return
+            start = time.perf_counter()
+            await queue.put((index, url, page))
+            self.fetch_stats.wait_seconds += time.perf_counter() - start
+            self.max_queue_depth = max(self.max_queue_depth, queue.qsize())
+
+        async def parse():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, url, page = item
+                start = time.perf_counter()
+                try:
+                    results[index], busy = await loop.run_in_executor(pool, _parse_page, page.body, page.encoding, url)
+                    self.parse_stats.record(start, time.perf_counter(), results[index] is None, busy=busy)
+                    self.metrics.observe("parse", busy)
+                    self.engine.remember(url, page, results[index])
+                except Exception as e:
+                    logger.error(f"Error parsing {url}: {e}")
+                    self.parse_stats.record(start, time.perf_counter(), True)
+                finish(index)
+
+        parsers = [asyncio.create_task(parse()) for _ in range(self.parse_workers)]
+        await self.engine.map(self._fetch, urls, enqueue)
+        for _ in parsers:
+            await queue.put(None)
+        await asyncio.gather(*parsers)
+        return results
+
+    def log_stats(self, log=logger):
+        log.info(self.fetch_stats.summary())
+        log.info(self.parse_stats.summary())
+        log.info(f"queue: max depth {self.max_queue_depth}/{self.queue_size}")
+        log.info(f"retries: {self.engine.retried} scheduled, {self.engine.gave_up} URLs given up")
+
+
+def check_availability_many(urls, max_concurrency=MAX_CONCURRENCY, per_host_limit=PER_HOST_LIMIT,
+                            timeout=TIMEOUT_SECONDS, progress=None, page_cache=None, retries=RETRIES, metrics=None):
+    """Same contract as fetcher.check_availability_many, with parsing on the process pool."""
+    urls = list(urls)
+    if page_cache:
+        page_cache.load(urls)
+    pipeline = SweepPipeline(max_concurrency, per_host_limit, timeout, page_cache=page_cache, retries=retries,
+                             metrics=metrics)
+    results = asyncio.run(pipeline.run(urls, progress))
+    if page_cache:
+        page_cache.save()
+    pipeline.log_stats()
+    return results
@@ -0,0 +1,199 @@
+import logging
+from collections import namedtuple
+from datetime import datetime
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+from url_info import extract_id_from_url
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUT_OF_STOCK_CLASS = "js-btn_out-of-stock"
+OUT_OF_STOCK_TITLES = {"Niet op voorraad", "Stock épuisé"}
+TITLE_CLASSES = {"js-product-title", "js-make-bold"}
+PRICE_TESTING_ID = "current-price"
+
+ProductFields = namedtuple("ProductFields", ["name", "price", "out_of_stock"])
+
+
+class _FieldCollector:
+    """Collects the product fields from start/end/data events in one pass over the page.
+
+    Implements both the lxml parser-target interface (start/end/data/close) and is
+    driven by _TokenizerParser for the stdlib backend, so both backends share the
+    matching rules.
+    """
+
+    def __init__(self):
+        self.out_of_stock = False
+        self.name_parts = None
+        self.price_parts = None
+        self._capture = None
+        self._capture_tag = None
+        self._depth = 0
+
+    def start(self, tag, attrib):
+        if self._capture is not None:
+            self._capture.append(None)
+            if tag == self._capture_tag:
+                self._depth += 1
+            return
+
+        if tag == "button":
+            if not self.out_of_stock and attrib.get("title") in OUT_OF_STOCK_TITLES:
+                self.out_of_stock = OUT_OF_STOCK_CLASS in (attrib.get("class") or "").split()
+        elif tag == "h1":
+            if self.name_parts is None and TITLE_CLASSES.issubset((attrib.get("class") or "").split()):
+                self.name_parts = []
+                self._begin_capture(tag, self.name_parts)
+        elif tag == "div":
+            if self.price_parts is None and attrib.get("data-testing-id") == PRICE_TESTING_ID:
+                self.price_parts = []
+                self._begin_capture(tag, self.price_parts)
+
+    def _begin_capture(self, tag, parts):
+        self._capture = parts
+        self._capture_tag = tag
+        self._depth = 1
+
+    def end(self, tag):
+        if self._capture is None:
+            return
+        self._capture.append(None)
+        if tag == self._capture_tag:
+            self._depth -= 1
+            if self._depth == 0:
+                self._capture = None
+
+    def data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+
+    def close(self):
+        name = price = None
+        if self.name_parts is not None:
+            # Same as BeautifulSoup's get_text(strip=True): strip each text node, not each data chunk
+            name = "".join(node.strip() for node in _text_nodes(self.name_parts))
+        if self.price_parts is not None:
+            price = "".join(_text_nodes(self.price_parts)).strip()
+        return ProductFields(name, price, self.out_of_stock)
+
+
+def _text_nodes(parts):
+    # parts holds data chunks with None wherever a tag started or ended
+    node = []
+    for part in parts:
+        if part is None:
+            if node:
+                yield "".join(node)
+                node = []
+        else:
+            node.append(part)
+    if node:
+        yield "".join(node)
+
+
+class _TokenizerParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+def _to_text(html):
+    if isinstance(html, bytes):
+        return html.decode("utf-8", errors="replace")
+    return html
+
+
+def _extract_stdlib(html):
+    collector = _FieldCollector()
+    parser = _TokenizerParser(collector)
+    parser.feed(_to_text(html))
+    parser.close()
+    return collector.close()
+
+
+def _extract_lxml(html):
+    parser = etree.HTMLParser(target=_FieldCollector())
+    parser.feed(html)
+    return parser.close()
+
+
+def _extract_bs4(html):
+    soup = BeautifulSoup(_to_text(html), "html.parser")
+
+    out_of_stock_button = soup.find("button", class_=OUT_OF_STOCK_CLASS, title="Niet op voorraad")
+    out_of_stock_button_fr = soup.find("button", class_=OUT_OF_STOCK_CLASS, title="Stock épuisé")
+    product_name_tag = soup.find("h1", class_="js-product-title js-make-bold")
+    price_tag = soup.find("div", attrs={"data-testing-id": PRICE_TESTING_ID})
+
+    return ProductFields(
+        product_name_tag.get_text(strip=True) if product_name_tag else None,
+        price_tag.text.strip() if price_tag else None,
+        bool(out_of_stock_button or out_of_stock_button_fr),
+    )
+
+
+BACKENDS = {
+    "lxml": _extract_lxml,
+    "stdlib": _extract_stdlib,
+    "bs4": _extract_bs4,
+}
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != "lxml" or etree is not None]
+
+
+DEFAULT_BACKEND = available_backends()[0]
+
+
+def extract_fields(html, backend=None):
+    """Pulls the product name, price and out-of-stock flag from a product page.
+
+    Falls back to BeautifulSoup if the selected streaming backend fails on the page.
+    """
+    backend = backend or DEFAULT_BACKEND
+    try:
+        return BACKENDS[backend](html)
+    except Exception as e:
+        if backend == "bs4":
+            raise
+        logger.warning(f"{backend} parser failed ({e}), falling back to BeautifulSoup")
+        return _extract_bs4(html)
+
+
+def extract_product(html, url, backend=None):
+    """Turns a product page into a (sku, name, date, url, status, type, price) record, or None."""
+    fields = extract_fields(html, backend)
+    if fields.name is None:
+        return None
+
+    product_type = "Ninja" if "ninja" in fields.name.lower() else "Shark"
+    zid_part = extract_id_from_url(url)
+    current_price = fields.price if fields.price is not None else "N/A"
+    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Pages without an out-of-stock button count as in stock, with or without an add-to-cart button
+    status = "OUT" if fields.out_of_stock else "IN"
+    return (zid_part, fields.name, current_date, url, status, product_type, current_price)
@@ -0,0 +1,154 @@
+"""SQL used by the dashboard pages and the price writer.
+
+Kept outside the page scripts so the schema module can check their query plans.
+"""
+
+DATAFRAME_INIT = """
+    SELECT p.SKU, l.LastSeen as LatestDate, l.Status
+    FROM ProductLastSeen l
+    JOIN Products p ON l.ProductID = p.ProductID
+    JOIN Countries c ON l.CountryID = c.CountryID
+    JOIN Brands b ON l.BrandID = b.BrandID
+    WHERE c.CountryCode = ? AND b.BrandName = ? AND l.Status IN ('IN', 'OUT')
+    ORDER BY l.LastSeen DESC;
+    """
+
+CURRENT_OUT_OF_STOCK = """
+    SELECT
+        p.SKU,
+        e.OutSince AS LastOutOfStockDate,
+        CAST((JULIANDAY('now') - JULIANDAY(e.OutSince)) AS INTEGER) AS DaysOutOfStock
+    FROM StockEpisodes e
+    JOIN Products p ON e.ProductID = p.ProductID
+    JOIN Countries c ON e.CountryID = c.CountryID
+    JOIN Brands b ON e.BrandID = b.BrandID
+    WHERE c.CountryCode = ? AND b.BrandName = ? AND e.BackInAt IS NULL
+    ORDER BY DaysOutOfStock DESC
+    """
+
+OUT_OF_STOCK_HISTORY = """
+    SELECT
+        p.SKU,
+        e.OutSince AS OutOfStockDate,
+        e.BackInAt AS BackInStockDate,
+        CASE
+            WHEN e.BackInAt IS NOT NULL THEN
+                MAX(1, CAST((JULIANDAY(e.BackInAt) - JULIANDAY(e.OutSince)) AS INTEGER))
+            ELSE
+                CAST((JULIANDAY('now') - JULIANDAY(e.OutSince)) AS INTEGER)
+        END AS DaysOutOfStock
+    FROM StockEpisodes e
+    JOIN Products p ON e.ProductID = p.ProductID
+    JOIN Countries c ON e.CountryID = c.CountryID
+    JOIN Brands b ON e.BrandID = b.BrandID
+    WHERE c.CountryCode = ? AND b.BrandName = ?
+    ORDER BY p.SKU, e.OutSince DESC
+    """
+
+OUT_OF_STOCK_DURATION = """
+    SELECT
+        p.SKU,
+        e.BackInAt AS BackInStockDate,
+        e.OutSince AS OutOfStockDate,
+        CAST((JULIANDAY(e.BackInAt) - JULIANDAY(e.OutSince)) AS INTEGER) AS DaysOutOfStock
+    FROM StockEpisodes e
+    JOIN Products p ON e.ProductID = p.ProductID
+    JOIN Countries c ON e.CountryID = c.CountryID
+    JOIN Brands b ON e.BrandID = b.BrandID
+    WHERE c.CountryCode = ? AND b.BrandName = ? AND e.BackInAt IS NOT NULL
+    ORDER BY e.BackInAt DESC
+    """
+
+# Raw status log, for rebuilding episodes (episodes.py)
+STATUS_HISTORY = """
+    SELECT p.SKU, datetime(ps.Date) AS DateTime, ps.Status
+    FROM ProductStatus ps
+    JOIN Countries c ON ps.CountryID = c.CountryID
+    JOIN Brands b ON ps.BrandID = b.BrandID
+    JOIN Products p ON ps.ProductID = p.ProductID
+    WHERE c.CountryCode = ? AND b.BrandName = ?
+    ORDER BY ps.ProductID, ps.Date
+    """
+
+PRICE_HISTORY = """
+            SELECT p.EntryDate, p.Price, p.Reason, c.CountryCode as country 
+            FROM Prices p
+            JOIN Products pr ON p.ProductID = pr.ProductID
+            JOIN Countries c ON p.CountryID = c.CountryID
+            WHERE pr.SKU = ?
+        """
+
+LATEST_PRICES = """
+    SELECT ProductID, CountryID, Price AS LastPrice FROM (
+        SELECT p.ProductID, p.CountryID, p.Price,
+               ROW_NUMBER() OVER (PARTITION BY p.ProductID, p.CountryID ORDER BY p.EntryDate DESC) AS rn
+        FROM temp.BatchKeys k
+        CROSS JOIN Prices p ON p.ProductID = k.ProductID AND p.CountryID = k.CountryID
+    )
+    WHERE rn = 1
+    """
+
+LAST_SEEN = """
+    SELECT l.ProductID, l.CountryID, l.LastSeen, l.Status, l.CurrentPrice
+    FROM temp.BatchKeys k
+    CROSS JOIN ProductLastSeen l ON l.ProductID = k.ProductID AND l.CountryID = k.CountryID
+    """
+
+# Snapshot exports (snapshots.py); conditions are appended as a WHERE clause
+STATUS_EXPORT = """
+    SELECT p.SKU, p.ProductName, ps.Date, u.url AS URL, ps.Status, ps.Type, ps.CurrentPrice, c.CountryCode, b.BrandName
+    FROM ProductStatus ps
+    JOIN Products p ON ps.ProductID = p.ProductID
+    JOIN Countries c ON ps.CountryID = c.CountryID
+    JOIN Brands b ON ps.BrandID = b.BrandID
+    JOIN SKU_URL su ON p.ProductID = su.SKUID
+    JOIN URLs u ON su.URLID = u.rowid
+    """
+
+PRICES_EXPORT = """
+    SELECT pr.SKU, p.Price, p.EntryDate, p.Reason, c.CountryCode as Country, COALESCE(b.BrandName, 'Unknown') as Brand
+    FROM Prices p
+    JOIN Products pr ON p.ProductID = pr.ProductID
+    JOIN Countries c ON p.CountryID = c.CountryID
+    LEFT JOIN ProductLastSeen l ON p.ProductID = l.ProductID AND p.CountryID = l.CountryID
+    LEFT JOIN Brands b ON l.BrandID = b.BrandID
+    """
+
+# Sweep URLs by country/brand group (url_info.fetch_grouped_urls)
+GROUP_URLS = """
+    SELECT Country, Brand, url
+    FROM urls
+    WHERE Country = ? AND Brand = ?
+    """
+
+ALL_GROUP_URLS = """
+    SELECT Country, Brand, url
+    FROM urls
+    WHERE Country IS NOT NULL AND Brand IS NOT NULL
+    ORDER BY Country, Brand
+    """
+
+# Scraper performance page (pages/performance.py); metrics.save_run writes these tables
+SCRAPE_RUNS = """
+    SELECT r.RunID, r.Kind, r.GroupKey, r.StartedAt, r.Seconds, r.URLs, r.Checked, r.Skipped, r.Errors,
+           r.FetchP50, r.FetchP95, r.DbWriteSeconds
+    FROM ScrapeRuns r
+    WHERE r.StartedAt >= ?
+    ORDER BY r.StartedAt
+    """
+
+RUN_STAGES = """
+    SELECT r.Kind, r.Stages
+    FROM ScrapeRuns r
+    WHERE r.StartedAt >= ?
+    """
+
+HOST_HEALTH = """
+    SELECT h.Host, COUNT(*) AS Runs, SUM(h.URLs) AS URLs, SUM(h.Requests) AS Requests, SUM(h.Skipped) AS Skipped,
+           SUM(h.Timeouts) AS Timeouts, SUM(h.Disconnects) AS Disconnects, SUM(h.StatusErrors) AS StatusErrors,
+           SUM(h.OtherErrors) AS OtherErrors
+    FROM ScrapeRuns r
+    JOIN ScrapeRunHosts h ON h.RunID = r.RunID
+    WHERE r.StartedAt >= ?
+    GROUP BY h.Host
+    """
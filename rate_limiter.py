@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Constants
+INITIAL_RATE = 20.0     # requests/sec per host
+MIN_RATE = 0.5
+MAX_RATE = 50.0
+BURST = 4               # tokens a quiet host can save up
+INCREASE = 0.5          # requests/sec added per successful request
+DECREASE = 0.5          # rate multiplier on a timeout, disconnect, 429 or 5xx
+DECREASE_INTERVAL = 1.0 # seconds; a burst of failures only halves the rate once
+BACKOFF_BASE = 1.0      # seconds before the first retry, doubled per attempt
+BACKOFF_MAX = 60.0
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before retry number attempt + 1: exponential, with jitter over the upper half.
+
+    A Retry-After header in seconds is honoured as a lower bound.
+    """
+    cap = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    delay = cap / 2 + random.uniform(0, cap / 2)
+    try:
+        delay = max(delay, min(BACKOFF_MAX, float(retry_after)))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+class TokenBucket:
+    """A token bucket whose refill rate goes up additively and down multiplicatively (AIMD)."""
+
+    def __init__(self, rate=INITIAL_RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Takes a token and returns 0, or returns how many seconds to wait for the next one."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            wait = (1 - self.tokens) / self.rate
+            self.waited += wait
+            return wait
+
+    def success(self):
+        with self._lock:
+            self.successes += 1
+            self.rate = min(MAX_RATE, self.rate + INCREASE)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= DECREASE_INTERVAL:
+                self.rate = max(MIN_RATE, self.rate * DECREASE)
+                self.last_decrease = now
+                # Don't let saved-up tokens send another burst at a struggling host
+                self.tokens = min(self.tokens, 1)
+
+
+class HostRateLimiter:
+    """One adaptive token bucket per host.
+
+    The fetcher reports every attempt: successes slowly raise a host's request
+    rate, timeouts and disconnects halve it. State is kept for the life of the
+    process, so the next sweep starts at the rate the host last tolerated.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket()
+            return self._buckets[host]
+
+    async def acquire(self, host):
+        bucket = self.bucket(host)
+        while True:
+            wait = bucket.take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def success(self, host):
+        self.bucket(host).success()
+
+    def failure(self, host):
+        bucket = self.bucket(host)
+        rate = bucket.rate
+        bucket.failure()
+        if bucket.rate < rate:
+            logger.warning(f"Slowing down {host} to {bucket.rate:.1f} requests/sec")
+
+    def set_rates(self, rates):
+        """Starts hosts at known rates, {host: requests/sec}, e.g. those another process ended with."""
+        for host, rate in rates.items():
+            bucket = self.bucket(host)
+            with bucket._lock:
+                bucket.rate = min(MAX_RATE, max(MIN_RATE, rate))
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {host: {"rate": b.rate, "successes": b.successes, "failures": b.failures, "waited": b.waited}
+                for host, b in buckets.items()}
+
+    def log_stats(self, log=logger):
+        for host, s in sorted(self.stats().items()):
+            log.info(f"{host}: {s['rate']:.1f} requests/sec, {s['successes']} ok, {s['failures']} failed, "
+                     f"throttled {s['waited']:.1f}s")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Returns the process-wide limiter shared by all fetch engines."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = HostRateLimiter()
+        return _limiter
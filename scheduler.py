@@ -0,0 +1,132 @@
+"""Per-URL check schedule.
+
+Each URL gets its own check interval. It halves when a check finds a new stock
+status or price, and it stretches while nothing changes. Products that are out
+of stock are rechecked at least every OUT_INTERVAL and come first in every
+sweep, so restocks are picked up within minutes. URLs that have never been
+checked are due immediately.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from db import reader, writer
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+CHUNK_SIZE = 500
+MIN_INTERVAL = 15 * 60          # seconds
+MAX_INTERVAL = 24 * 60 * 60
+OUT_INTERVAL = 15 * 60          # out-of-stock products are checked at least this often
+FAILED_INTERVAL = 15 * 60       # retry a URL that could not be checked
+BACKOFF = 1.5                   # interval multiplier after a check without changes
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def due_urls(db_name=DB_NAME, now=None, limit=None, group=None):
+    """Returns the URLs that are due, out-of-stock products first, then the most overdue.
+
+    group is a country/brand key like "NLShark" to only return that group's URLs.
+    """
+    now = (now or datetime.now()).strftime(DATE_FORMAT)
+    params = [now]
+    group_filter = ""
+    if group is not None:
+        group_filter = "AND u.Country = ? AND u.Brand = ?"
+        params += [group[:2], group[2:]]
+    query = f"""
+        SELECT u.url
+        FROM urls u
+        LEFT JOIN UrlSchedule s ON s.URL = u.url
+        WHERE (s.NextCheck IS NULL OR s.NextCheck <= ?) {group_filter}
+        ORDER BY COALESCE(s.LastStatus = 'OUT', 0) DESC, s.NextCheck IS NOT NULL, s.NextCheck
+    """
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    with reader(db_name) as conn:
+        return [row[0] for row in conn.execute(query, params).fetchall()]
+
+
+def seconds_until_next_due(db_name=DB_NAME, now=None):
+    """Seconds until the next URL is due; 0 when one already is, None when there are no URLs."""
+    now = now or datetime.now()
+    with reader(db_name) as conn:
+        unscheduled, next_check = conn.execute("""
+            SELECT SUM(s.URL IS NULL), MIN(s.NextCheck)
+            FROM urls u
+            LEFT JOIN UrlSchedule s ON s.URL = u.url
+        """).fetchone()
+    if unscheduled:
+        return 0
+    if next_check is None:
+        return None
+    return max(0.0, (datetime.strptime(next_check, DATE_FORMAT) - now).total_seconds())
+
+
+def _load(conn, urls):
+    schedule = {}
+    for start in range(0, len(urls), CHUNK_SIZE):
+        chunk = urls[start:start + CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in conn.execute(f"""
+            SELECT URL, Interval, LastStatus, LastPrice, Checks, Changes, LastChanged
+            FROM UrlSchedule WHERE URL IN ({placeholders})
+        """, chunk):
+            schedule[row[0]] = row[1:]
+    return schedule
+
+
+def next_interval(interval, changed, status):
+    if interval is None:
+        interval = MIN_INTERVAL
+    elif changed:
+        interval = max(MIN_INTERVAL, interval / 2)
+    else:
+        interval = min(MAX_INTERVAL, interval * BACKOFF)
+    if status == "OUT":
+        interval = min(interval, OUT_INTERVAL)
+    return interval
+
+
+def record_checks(results, db_name=DB_NAME, now=None):
+    """Reschedules every checked URL; results maps URL to its record, or None if it couldn't be checked.
+
+    Returns the number of URLs whose status or price changed since their last check.
+    """
+    now = now or datetime.now()
+    checked_at = now.strftime(DATE_FORMAT)
+    urls = list(results)
+    rows = []
+    changes = 0
+    with writer(db_name) as conn:
+        schedule = _load(conn, urls)
+        for url in urls:
+            record = results[url]
+            interval, last_status, last_price, checks, changed_count, last_changed = \
+                schedule.get(url, (None, None, None, 0, 0, None))
+            if record is None:
+                next_check = now + timedelta(seconds=FAILED_INTERVAL)
+                rows.append((url, next_check.strftime(DATE_FORMAT), interval, checked_at, last_changed,
+                             last_status, last_price, checks, changed_count))
+                continue
+
+            status, price = record[4], record[6]
+            changed = interval is not None and (status, price) != (last_status, last_price)
+            if changed:
+                changes += 1
+                changed_count += 1
+                last_changed = checked_at
+            interval = next_interval(interval, changed, status)
+            next_check = now + timedelta(seconds=interval)
+            rows.append((url, next_check.strftime(DATE_FORMAT), interval, checked_at, last_changed,
+                         status, price, checks + 1, changed_count))
+
+        conn.executemany("""
+            INSERT OR REPLACE INTO UrlSchedule
+            (URL, NextCheck, Interval, LastChecked, LastChanged, LastStatus, LastPrice, Checks, Changes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    logger.info(f"Rescheduled {len(rows)} URLs, {changes} changed since their last check")
+    return changes
@@ -0,0 +1,404 @@
+"""Versioned schema for Sharkninja.db.
+
+Every entry point calls migrate() at startup. Applied migrations are tracked in
+PRAGMA user_version, so running it again is a single pragma read. Tables are
+created with IF NOT EXISTS because existing databases were built by hand.
+
+    python schema.py                 # migrate Sharkninja.db
+    python schema.py --check-plans   # fail if a dashboard query falls back to a full scan
+"""
+import argparse
+import logging
+import re
+import sqlite3
+import sys
+import threading
+
+import queries
+import url_info
+from db import connect
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+
+MIGRATIONS = [
+    # 1: the tables the scrapers and dashboards already use
+    [
+        """CREATE TABLE IF NOT EXISTS Countries (
+            CountryID INTEGER PRIMARY KEY AUTOINCREMENT,
+            CountryCode TEXT NOT NULL UNIQUE
+        )""",
+        """CREATE TABLE IF NOT EXISTS Brands (
+            BrandID INTEGER PRIMARY KEY AUTOINCREMENT,
+            BrandName TEXT NOT NULL UNIQUE
+        )""",
+        """CREATE TABLE IF NOT EXISTS Products (
+            ProductID INTEGER PRIMARY KEY AUTOINCREMENT,
+            SKU TEXT NOT NULL UNIQUE,
+            ProductName TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS urls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT UNIQUE
+        )""",
+        """CREATE TABLE IF NOT EXISTS SKU_URL (
+            SKUID INTEGER NOT NULL,
+            URLID INTEGER NOT NULL,
+            PRIMARY KEY (SKUID, URLID)
+        )""",
+        """CREATE TABLE IF NOT EXISTS ProductStatus (
+            ProductID INTEGER NOT NULL,
+            CountryID INTEGER NOT NULL,
+            BrandID INTEGER NOT NULL,
+            Date TEXT NOT NULL,
+            Status TEXT,
+            Type TEXT,
+            CurrentPrice TEXT,
+            PRIMARY KEY (ProductID, CountryID, Date)
+        )""",
+        """CREATE TABLE IF NOT EXISTS Prices (
+            PriceID INTEGER PRIMARY KEY AUTOINCREMENT,
+            ProductID INTEGER NOT NULL,
+            CountryID INTEGER NOT NULL,
+            Price REAL,
+            EntryDate TEXT NOT NULL,
+            Reason TEXT,
+            UNIQUE (ProductID, CountryID, EntryDate)
+        )""",
+        """CREATE TABLE IF NOT EXISTS FailedInserts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            SKU TEXT,
+            ProductName TEXT,
+            Country TEXT,
+            Brand TEXT,
+            Date TEXT,
+            URL TEXT,
+            Status TEXT,
+            Type TEXT,
+            CurrentPrice TEXT,
+            ErrorMessage TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS swaggers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS login_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            success BOOLEAN NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS DataVersions (
+            Name TEXT PRIMARY KEY,
+            Version INTEGER NOT NULL DEFAULT 0
+        )""",
+    ],
+    # 2: covering indexes for the dashboard queries and the price writer
+    [
+        # get_dataframe_init, get_current_out_of_stock, get_out_of_stock_history, read_from_db
+        """CREATE INDEX IF NOT EXISTS idx_productstatus_country_brand
+           ON ProductStatus (CountryID, BrandID, ProductID, Date, Status)""",
+        # get_price_history and the latest-price lookup in save_prices
+        """CREATE INDEX IF NOT EXISTS idx_prices_product_country_date
+           ON Prices (ProductID, CountryID, EntryDate, Price)""",
+        # get_price_changes_by_date
+        """CREATE INDEX IF NOT EXISTS idx_prices_country_date
+           ON Prices (CountryID, EntryDate)""",
+        "ANALYZE",
+    ],
+    # 3: validators and last parsed record per product page, for conditional fetching
+    [
+        """CREATE TABLE IF NOT EXISTS PageCache (
+            URL TEXT PRIMARY KEY,
+            ETag TEXT,
+            LastModified TEXT,
+            BodyHash TEXT NOT NULL,
+            Record TEXT NOT NULL,
+            FetchedAt TEXT NOT NULL
+        )""",
+    ],
+    # 4: per-URL check schedule
+    [
+        """CREATE TABLE IF NOT EXISTS UrlSchedule (
+            URL TEXT PRIMARY KEY,
+            NextCheck TEXT NOT NULL,
+            Interval REAL,
+            LastChecked TEXT,
+            LastChanged TEXT,
+            LastStatus TEXT,
+            LastPrice TEXT,
+            Checks INTEGER NOT NULL DEFAULT 0,
+            Changes INTEGER NOT NULL DEFAULT 0
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_urlschedule_nextcheck ON UrlSchedule (NextCheck)",
+    ],
+    # 5: job queue and per-group schedules for the worker daemon
+    [
+        """CREATE TABLE IF NOT EXISTS Jobs (
+            JobID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Kind TEXT NOT NULL,
+            GroupKey TEXT,
+            Payload TEXT,
+            Status TEXT NOT NULL,
+            Priority INTEGER NOT NULL DEFAULT 0,
+            CreatedAt TEXT NOT NULL,
+            RunAfter TEXT NOT NULL,
+            StartedAt TEXT,
+            FinishedAt TEXT,
+            HeartbeatAt TEXT,
+            Worker TEXT,
+            Attempts INTEGER NOT NULL DEFAULT 0,
+            Progress INTEGER,
+            Total INTEGER,
+            Result TEXT,
+            Error TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON Jobs (Status, RunAfter, Priority)",
+        """CREATE TABLE IF NOT EXISTS JobSchedules (
+            Name TEXT PRIMARY KEY,
+            Kind TEXT NOT NULL,
+            GroupKey TEXT,
+            Payload TEXT,
+            Cron TEXT NOT NULL,
+            NextRun TEXT NOT NULL,
+            LastRun TEXT
+        )""",
+    ],
+    # 6: out-of-stock episodes, kept up to date by db_writer.save_products and
+    # backfilled here from the existing history
+    [
+        """CREATE TABLE IF NOT EXISTS StockEpisodes (
+            EpisodeID INTEGER PRIMARY KEY,
+            ProductID INTEGER NOT NULL,
+            CountryID INTEGER NOT NULL,
+            BrandID INTEGER,
+            OutSince TEXT NOT NULL,
+            BackInAt TEXT,
+            UNIQUE (ProductID, CountryID, OutSince),
+            FOREIGN KEY (ProductID) REFERENCES Products(ProductID),
+            FOREIGN KEY (CountryID) REFERENCES Countries(CountryID),
+            FOREIGN KEY (BrandID) REFERENCES Brands(BrandID)
+        )""",
+        # At most one open episode per product and country
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_stockepisodes_open
+           ON StockEpisodes (ProductID, CountryID) WHERE BackInAt IS NULL""",
+        """CREATE INDEX IF NOT EXISTS idx_stockepisodes_country_brand
+           ON StockEpisodes (CountryID, BrandID, ProductID, OutSince, BackInAt)""",
+        # An episode starts at an OUT whose previous status was IN (or that is the
+        # first status) and ends at the next IN
+        """INSERT OR IGNORE INTO StockEpisodes (ProductID, CountryID, BrandID, OutSince, BackInAt)
+           SELECT ProductID, CountryID, BrandID, DateTime, NextIn
+           FROM (
+               SELECT ProductID, CountryID, BrandID, datetime(Date) AS DateTime, Status,
+                      LAG(Status) OVER (PARTITION BY ProductID, CountryID ORDER BY Date) AS PrevStatus,
+                      MIN(CASE WHEN Status = 'IN' THEN datetime(Date) END) OVER (
+                          PARTITION BY ProductID, CountryID ORDER BY Date DESC
+                          ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                      ) AS NextIn
+               FROM ProductStatus
+           )
+           WHERE Status = 'OUT' AND (PrevStatus IS NULL OR PrevStatus = 'IN')""",
+        "ANALYZE StockEpisodes",
+    ],
+    # 7: last known state and heartbeat per product and country; from now on
+    # ProductStatus only gets a row when the status or price changes
+    [
+        """CREATE TABLE IF NOT EXISTS ProductLastSeen (
+            ProductID INTEGER NOT NULL,
+            CountryID INTEGER NOT NULL,
+            BrandID INTEGER NOT NULL,
+            LastSeen TEXT NOT NULL,
+            Status TEXT,
+            Type TEXT,
+            CurrentPrice TEXT,
+            PRIMARY KEY (ProductID, CountryID),
+            FOREIGN KEY (ProductID) REFERENCES Products(ProductID),
+            FOREIGN KEY (CountryID) REFERENCES Countries(CountryID),
+            FOREIGN KEY (BrandID) REFERENCES Brands(BrandID)
+        )""",
+        # get_dataframe_init
+        """CREATE INDEX IF NOT EXISTS idx_productlastseen_country_brand
+           ON ProductLastSeen (CountryID, BrandID, LastSeen, Status)""",
+        """INSERT OR REPLACE INTO ProductLastSeen
+           (ProductID, CountryID, BrandID, LastSeen, Status, Type, CurrentPrice)
+           SELECT ProductID, CountryID, BrandID, Date, Status, Type, CurrentPrice
+           FROM (
+               SELECT *, ROW_NUMBER() OVER (PARTITION BY ProductID, CountryID ORDER BY Date DESC) AS rn
+               FROM ProductStatus
+           )
+           WHERE rn = 1""",
+        "ANALYZE ProductLastSeen",
+    ],
+    # 8: the current month of Prices, read from SQLite next to the Parquet snapshot
+    [
+        "CREATE INDEX IF NOT EXISTS idx_prices_entrydate ON Prices (EntryDate)",
+    ],
+    # 9: parsed host, market and SKU of every URL, so sweeps select a group with an index
+    [
+        "ALTER TABLE urls ADD COLUMN Host TEXT",
+        "ALTER TABLE urls ADD COLUMN Country TEXT",
+        "ALTER TABLE urls ADD COLUMN Brand TEXT",
+        "ALTER TABLE urls ADD COLUMN SKU TEXT",
+        url_info.store_parsed,
+        # url_info.fetch_grouped_urls and scheduler.due_urls per group
+        "CREATE INDEX IF NOT EXISTS idx_urls_country_brand ON urls (Country, Brand)",
+        "ANALYZE urls",
+    ],
+    # 10: one row per scraper sweep with its timings (metrics.save_run), and its requests per host
+    [
+        """CREATE TABLE IF NOT EXISTS ScrapeRuns (
+            RunID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Kind TEXT NOT NULL,
+            GroupKey TEXT,
+            StartedAt TEXT NOT NULL,
+            FinishedAt TEXT NOT NULL,
+            Seconds REAL NOT NULL,
+            URLs INTEGER NOT NULL,
+            Checked INTEGER NOT NULL,
+            Skipped INTEGER NOT NULL,
+            Errors INTEGER NOT NULL,
+            FetchP50 REAL,
+            FetchP95 REAL,
+            DbWriteSeconds REAL,
+            Stages TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_scraperuns_startedat ON ScrapeRuns (StartedAt)",
+        """CREATE TABLE IF NOT EXISTS ScrapeRunHosts (
+            RunID INTEGER NOT NULL,
+            Host TEXT NOT NULL,
+            Requests INTEGER NOT NULL,
+            Skipped INTEGER NOT NULL,
+            Timeouts INTEGER NOT NULL,
+            Disconnects INTEGER NOT NULL,
+            StatusErrors INTEGER NOT NULL,
+            OtherErrors INTEGER NOT NULL,
+            PRIMARY KEY (RunID, Host),
+            FOREIGN KEY (RunID) REFERENCES ScrapeRuns(RunID)
+        )""",
+    ],
+    # 11: URLs per host and run, for the skip rate on the performance page
+    [
+        "ALTER TABLE ScrapeRunHosts ADD COLUMN URLs INTEGER NOT NULL DEFAULT 0",
+    ],
+    # 12: a group's latest job for the dashboard, and the queued job jobs.submit merges into;
+    # databases created after migration 5 already have it
+    [
+        "CREATE INDEX IF NOT EXISTS idx_jobs_kind_group ON Jobs (Kind, GroupKey, JobID)",
+    ],
+    # 13: snapshot jobs get a group key (worker.SNAPSHOT_GROUP), so jobs.claim runs one at a time
+    [
+        "UPDATE JobSchedules SET GroupKey = 'snapshots' WHERE Kind = 'snapshot' AND GroupKey IS NULL",
+        "UPDATE Jobs SET GroupKey = 'snapshots' WHERE Kind = 'snapshot' AND GroupKey IS NULL",
+    ],
+]
+
+def _apply(conn, statement):
+    # Backfills that need Python are functions of the connection
+    if callable(statement):
+        statement(conn)
+    else:
+        conn.execute(statement)
+
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def migrate(db_name=DB_NAME):
+    """Brings db_name up to the latest schema version; cheap to call repeatedly."""
+    with _migrated_lock:
+        if db_name in _migrated:
+            return
+        conn = connect(db_name)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                logger.info(f"Applying schema migration {number} to {db_name}")
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for statement in statements:
+                        _apply(conn, statement)
+                    conn.execute(f"PRAGMA user_version = {number}")
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        finally:
+            conn.close()
+        _migrated.add(db_name)
+
+
+# (name, query, parameters, table aliases that must be read through an index)
+PLAN_CHECKS = [
+    ("get_dataframe_init", queries.DATAFRAME_INIT, ("NL", "Shark"), {"l"}),
+    ("read_from_db", queries.STATUS_EXPORT + " WHERE c.CountryCode = ? AND b.BrandName = ? AND ps.Date >= ?",
+     ("NL", "Shark", "2024-09-01"), {"ps"}),
+    ("get_current_out_of_stock", queries.CURRENT_OUT_OF_STOCK, ("NL", "Shark"), {"e"}),
+    ("get_out_of_stock_history", queries.OUT_OF_STOCK_HISTORY, ("NL", "Shark"), {"e"}),
+    ("get_out_of_stock_duration", queries.OUT_OF_STOCK_DURATION, ("NL", "Shark"), {"e"}),
+    ("episodes.read_status_history", queries.STATUS_HISTORY, ("NL", "Shark"), {"ps"}),
+    ("get_price_history", queries.PRICE_HISTORY + " AND c.CountryCode = ?", ("IZ400EU", "NL"), {"p"}),
+    ("url_info.fetch_grouped_urls", queries.GROUP_URLS, ("NL", "Shark"), {"urls"}),
+    ("performance page runs", queries.SCRAPE_RUNS, ("2024-09-01",), {"r"}),
+    ("performance page host health", queries.HOST_HEALTH, ("2024-09-01",), {"r", "h"}),
+    ("export_prices after the snapshot", queries.PRICES_EXPORT + " WHERE p.EntryDate >= ?", ("2024-09-01",), {"p"}),
+]
+
+
+# Lookups joined with the temp.BatchKeys table of the batch being written
+BATCH_PLAN_CHECKS = [
+    ("save_prices latest price", queries.LATEST_PRICES, (), {"p"}),
+    ("save_products last seen", queries.LAST_SEEN, (), {"l"}),
+]
+
+def full_scans(conn, query, params, aliases):
+    """Returns the EXPLAIN QUERY PLAN lines that scan one of aliases instead of searching it.
+
+    A scan of a (covering) index still reads every row, so only SEARCH passes.
+    """
+    plan = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and match.group(1) in aliases:
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans(conn):
+    """Returns {query name: [full scan details]} for the queries that regressed."""
+    if conn.execute("SELECT name FROM sqlite_master WHERE name = 'BatchKeys'").fetchone() is None:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS BatchKeys (ProductID INTEGER, CountryID INTEGER)")
+    checks = PLAN_CHECKS + BATCH_PLAN_CHECKS
+    failures = {}
+    for name, query, params, aliases in checks:
+        scans = full_scans(conn, query, params, aliases)
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--check-plans", action="store_true", help="check the query plans on an empty copy of the schema")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not args.check_plans:
+        migrate(args.db)
+        sys.exit(0)
+
+    conn = sqlite3.connect(":memory:")
+    for statements in MIGRATIONS:
+        for statement in statements:
+            _apply(conn, statement)
+    failures = check_query_plans(conn)
+    for name, scans in failures.items():
+        print(f"FAIL {name}: " + "; ".join(scans))
+    print(f"{len(PLAN_CHECKS) + len(BATCH_PLAN_CHECKS) - len(failures)} query plans use indexes, {len(failures)} full scans")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,200 @@
+"""Sharded sweeps: the URLs split by host over worker processes, with one database writer.
+
+    python scheduledstart.py --processes 4
+
+A single sweep process fetches at most MAX_CONCURRENCY pages at a time over all
+hosts and parses them on one pool, so every market added makes the sweep
+longer. Here every host is assigned to exactly one shard, shards are balanced
+by URL count, and each shard runs its own fetch pipeline and parser pool in a
+separate process. Its host's concurrency limit and adaptive rate limiter live in
+that one process, so the politeness limits are the same as in a single-process
+sweep.
+
+Shards don't write to the database. They send their results in batches of
+RESULT_BATCH over a queue to the parent process, which reschedules the URLs of
+every batch and saves the products and prices of a country/brand group as soon
+as all its URLs are in, while the shards keep fetching. Page cache updates and
+the rates each host ended at come back with the shard's last message; the rates
+are handed to the shards of the next sweep.
+"""
+import asyncio
+import heapq
+import logging
+import multiprocessing
+import queue
+import time
+
+from metrics import RunMetrics, save_run
+from page_cache import PageCache
+from pipeline import PARSE_WORKERS, SweepPipeline, shutdown_parse_pool
+from rate_limiter import get_rate_limiter
+from scheduledstart import TIMEOUT_SECONDS, save_group
+from scheduler import record_checks
+from url_info import parse_url
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+PROCESSES = 4
+RESULT_BATCH = 200          # results per message from a shard to the writer
+POLL_SECONDS = 5            # how often the writer checks for shards that died without reporting
+
+
+def assign_shards(urls, processes=PROCESSES):
+    """Splits urls into at most processes lists so that every host is in exactly one.
+
+    Hosts are handed out largest first to the shard with the fewest URLs. URLs
+    keep their order within a shard, so out-of-stock products stay first.
+    """
+    counts = {}
+    for url in urls:
+        host = parse_url(url).host
+        counts[host] = counts.get(host, 0) + 1
+    loads = [(0, shard) for shard in range(max(1, min(processes, len(counts))))]
+    shard_of = {}
+    for host, count in sorted(counts.items(), key=lambda item: -item[1]):
+        load, shard = heapq.heappop(loads)
+        shard_of[host] = shard
+        heapq.heappush(loads, (load + count, shard))
+    shards = [[] for _ in loads]
+    for url in urls:
+        shards[shard_of[parse_url(url).host]].append(url)
+    return shards
+
+
+class _Lines:
+    # Collects log lines in a shard process, to be logged by the parent
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lines = []
+
+    def info(self, message):
+        self.lines.append(f"{self.prefix}{message}")
+
+    warning = info
+
+
+def _run_shard(shard, urls, db_name, rates, parse_workers, messages):
+    # Runs in a shard process: fetch and parse, and send everything to the writer
+    try:
+        get_rate_limiter().set_rates(rates)
+        page_cache = PageCache(db_name)
+        page_cache.load(urls)
+        pipeline = SweepPipeline(timeout=TIMEOUT_SECONDS, parse_workers=parse_workers, page_cache=page_cache,
+                                 metrics=RunMetrics("shard"))
+        batch = []
+
+        def on_result(url, record):
+            batch.append((url, record))
+            if len(batch) >= RESULT_BATCH:
+                messages.put(("results", shard, batch[:]))
+                batch.clear()
+
+        start = time.perf_counter()
+        asyncio.run(pipeline.run(urls, on_result=on_result))
+        if batch:
+            messages.put(("results", shard, batch))
+
+        log = _Lines(f"shard {shard + 1}: ")
+        log.info(f"{len(urls)} URLs in {time.perf_counter() - start:.1f}s")
+        pipeline.log_stats(log)
+        page_cache.log_stats(log)
+        get_rate_limiter().log_stats(log)
+        messages.put(("done", shard, {
+            "page_cache": page_cache.take_updates(),
+            "rates": {host: stats["rate"] for host, stats in get_rate_limiter().stats().items()},
+            "metrics": pipeline.metrics,
+            "log": log.lines,
+        }))
+    except BaseException as e:
+        messages.put(("error", shard, f"{type(e).__name__}: {e}"))
+    finally:
+        shutdown_parse_pool()
+
+
+def _write(batch, category_of, pending, remaining, summary, run, db_name):
+    # The parent is the only process that writes. Groups are saved once, complete, so
+    # save_group sees every URL of a SKU and its counts cover the whole group
+    results = dict(batch)
+    run.checked_urls(results, lambda url: parse_url(url).host)
+    with run.timer("db_write"):
+        record_checks(results, db_name)
+    for url, record in batch:
+        category = category_of[url]
+        urls, records = pending.setdefault(category, ([], []))
+        urls.append(url)
+        records.append(record)
+        remaining[category] -= 1
+        if not remaining[category]:
+            summary[category] = save_group(category, urls, records, db_name, run)
+            del pending[category]
+
+
+def sharded_sweep(grouped_urls, processes=PROCESSES, db_name=DB_NAME, progress=None):
+    """Checks grouped_urls ({"NLShark": [url, ...]}) in shard processes; same summary as check_stock."""
+    category_of = {url: category for category, urls in grouped_urls.items() for url in urls}
+    urls = list(category_of)
+    summary = {category: {"out": 0, "in": 0, "skipped": 0} for category in grouped_urls}
+    if not urls:
+        return summary
+
+    run = RunMetrics("sharded", ",".join(grouped_urls))
+    pending = {}        # category: (urls, records) received so far
+    remaining = dict.fromkeys(grouped_urls, 0)      # URLs per category still to come
+    for category in category_of.values():
+        remaining[category] += 1
+    shards = assign_shards(urls, processes)
+    # spawn, as on Windows: the parent holds database connections and threads
+    context = multiprocessing.get_context("spawn")
+    messages = context.Queue()
+    rates = {host: stats["rate"] for host, stats in get_rate_limiter().stats().items()}
+    parse_workers = max(1, PARSE_WORKERS // len(shards))
+    workers = [context.Process(target=_run_shard, name=f"shard-{shard + 1}",
+                               args=(shard, shard_urls, db_name, rates, parse_workers, messages))
+               for shard, shard_urls in enumerate(shards)]
+    logger.info(f"Checking {len(urls)} URLs in {len(shards)} shards: "
+                + ", ".join(str(len(shard_urls)) for shard_urls in shards))
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+
+    running = set(range(len(workers)))
+    done = 0
+    page_cache = PageCache(db_name)
+    while running:
+        try:
+            kind, shard, payload = messages.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            for shard in list(running):
+                if not workers[shard].is_alive():
+                    logger.error(f"Shard {shard + 1} exited with code {workers[shard].exitcode} before finishing")
+                    running.discard(shard)
+            continue
+
+        if kind == "results":
+            _write(payload, category_of, pending, remaining, summary, run, db_name)
+            done += len(payload)
+            if progress:
+                progress(done, len(urls))
+        elif kind == "done":
+            page_cache.save(payload["page_cache"])
+            get_rate_limiter().set_rates(payload["rates"])
+            run.merge(payload["metrics"])
+            for line in payload["log"]:
+                logger.info(line)
+            running.discard(shard)
+        else:
+            logger.error(f"Shard {shard + 1} failed: {payload}")
+            running.discard(shard)
+
+    for worker in workers:
+        worker.join()
+    # Groups of a shard that died; save what did come in
+    for category, (category_urls, records) in pending.items():
+        logger.warning(f"Saving {category} without the {remaining[category]} URLs of a failed shard")
+        summary[category] = save_group(category, category_urls, records, db_name, run)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Sharded sweep: {done} of {len(urls)} URLs in {elapsed:.1f}s ({done / elapsed:.1f} URLs/sec)")
+    save_run(run, db_name)
+    return summary
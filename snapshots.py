@@ -0,0 +1,263 @@
+"""Parquet snapshots of the status and price history for long-range reads.
+
+    python snapshots.py [--db Sharkninja.db] [--table status|prices]
+
+Every complete month of ProductStatus (with the product, URL, country and brand
+columns of the Excel export) and of Prices is written to
+
+    snapshots/<table>/country=NL/brand=Shark/month=2024-09/part-0.parquet
+
+next to the database. Rows are streamed from SQLite in chunks of CHUNK_ROWS and
+buffered per partition up to ROW_GROUP_ROWS, so memory doesn't grow with the
+history. A new snapshot is built next to the old one and swapped in when it is
+complete. The worker daemon refreshes the snapshots every night.
+
+read_range() reads a country/brand/date range and iter_range() streams it in
+chunks: complete months come from the snapshot, opening only the partitions
+that match; the current month, and everything when there is no snapshot or
+pyarrow isn't installed, comes from SQLite. Changes to months that are already
+in the snapshot, like a price entered for an earlier date, show up after the
+next refresh.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import pandas as pd
+
+from db import reader
+from queries import PRICES_EXPORT, STATUS_EXPORT
+from schema import migrate
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+SNAPSHOT_DIR = "snapshots"
+MANIFEST = "_snapshot.json"
+CHUNK_ROWS = 100_000        # rows per read from SQLite
+ROW_GROUP_ROWS = 50_000     # rows buffered per partition before they are written
+PARTITIONS = ["country", "brand", "month"]
+
+# query: SELECT without WHERE; the *_sql fields are the SQL expressions of the
+# date, country and brand columns, used in the conditions appended to it
+SnapshotTable = namedtuple("SnapshotTable", "query columns date date_sql country country_sql brand brand_sql")
+
+TABLES = {
+    "status": SnapshotTable(
+        STATUS_EXPORT,
+        ["SKU", "ProductName", "Date", "URL", "Status", "Type", "CurrentPrice", "CountryCode", "BrandName"],
+        "Date", "ps.Date", "CountryCode", "c.CountryCode", "BrandName", "b.BrandName",
+    ),
+    "prices": SnapshotTable(
+        PRICES_EXPORT,
+        ["SKU", "Price", "EntryDate", "Reason", "Country", "Brand"],
+        "EntryDate", "p.EntryDate", "Country", "c.CountryCode", "Brand", "COALESCE(b.BrandName, 'Unknown')",
+    ),
+}
+
+
+def available():
+    return pa is not None
+
+
+def snapshot_path(table, db_name=DB_NAME):
+    return os.path.join(os.path.dirname(os.path.abspath(db_name)), SNAPSHOT_DIR, table)
+
+
+def month_start(moment=None):
+    return (moment or datetime.now()).strftime("%Y-%m-01")
+
+
+def _file_schema(spec):
+    # Country and brand are stored in the directory names only
+    fields = [(column, pa.float64() if column == "Price" else pa.string())
+              for column in spec.columns if column not in (spec.country, spec.brand)]
+    return pa.schema(fields)
+
+
+def load_manifest(table, db_name=DB_NAME):
+    try:
+        with open(os.path.join(snapshot_path(table, db_name), MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def export_table(table, db_name=DB_NAME, cutoff=None):
+    """Writes every row dated before cutoff (default: the start of this month) to a new snapshot.
+
+    Returns the manifest: cutoff, export time, rows, partitions and seconds taken.
+    """
+    if not available():
+        raise RuntimeError("Parquet snapshots need pyarrow (pip install pyarrow)")
+    spec = TABLES[table]
+    cutoff = cutoff or month_start()
+    schema = _file_schema(spec)
+    root = snapshot_path(table, db_name)
+    building = root + ".tmp"
+    shutil.rmtree(building, ignore_errors=True)
+    start = time.perf_counter()
+
+    writers = {}
+    buffers = {}
+    buffered = {}
+
+    def flush(key):
+        frame = pd.concat(buffers.pop(key), ignore_index=True)
+        buffered.pop(key)
+        if key not in writers:
+            directory = os.path.join(building, *(f"{name}={value}" for name, value in zip(PARTITIONS, key)))
+            os.makedirs(directory, exist_ok=True)
+            writers[key] = pq.ParquetWriter(os.path.join(directory, "part-0.parquet"), schema, compression="zstd")
+        writers[key].write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+    rows = 0
+    try:
+        with reader(db_name) as conn:
+            query = f"{spec.query} WHERE {spec.date_sql} < ?"
+            for chunk in pd.read_sql_query(query, conn, params=(cutoff,), chunksize=CHUNK_ROWS):
+                rows += len(chunk)
+                chunk[spec.brand] = chunk[spec.brand].fillna("Unknown")
+                months = chunk[spec.date].astype(str).str[:7]
+                for key, part in chunk.groupby([chunk[spec.country], chunk[spec.brand], months], sort=False):
+                    buffers.setdefault(key, []).append(part.drop(columns=[spec.country, spec.brand]))
+                    buffered[key] = buffered.get(key, 0) + len(part)
+                    if buffered[key] >= ROW_GROUP_ROWS:
+                        flush(key)
+        for key in list(buffers):
+            flush(key)
+    except BaseException:
+        for parquet_writer in writers.values():
+            parquet_writer.close()
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    for parquet_writer in writers.values():
+        parquet_writer.close()
+
+    manifest = {
+        "table": table,
+        "cutoff": cutoff,
+        "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": rows,
+        "partitions": len(writers),
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+    os.makedirs(building, exist_ok=True)
+    with open(os.path.join(building, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+
+    # Swap the new snapshot in; readers that already opened the old files keep them
+    previous = root + ".old"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(root):
+        os.rename(root, previous)
+    os.rename(building, root)
+    shutil.rmtree(previous, ignore_errors=True)
+    logger.info(f"Snapshot of {table}: {rows} rows before {cutoff} in {len(writers)} partitions "
+                f"({manifest['seconds']}s)")
+    return manifest
+
+
+def export_all(db_name=DB_NAME, cutoff=None):
+    migrate(db_name)
+    return {table: export_table(table, db_name, cutoff) for table in TABLES}
+
+
+def _conditions(spec, country, brand, start, end):
+    conditions, params = [], []
+    for sql, value, operator in [(spec.country_sql, country, "="), (spec.brand_sql, brand, "="),
+                                 (spec.date_sql, start, ">="), (spec.date_sql, end, "<")]:
+        if value is not None:
+            conditions.append(f"{sql} {operator} ?")
+            params.append(value)
+    return conditions, params
+
+
+def _iter_sqlite(spec, db_name, country, brand, start, end, chunk_rows):
+    conditions, params = _conditions(spec, country, brand, start, end)
+    query = spec.query + (" WHERE " + " AND ".join(conditions) if conditions else "")
+    with reader(db_name) as conn:
+        yield from pd.read_sql_query(query, conn, params=params, chunksize=chunk_rows)
+
+
+def _iter_snapshot(table, spec, db_name, country, brand, start, end, chunk_rows):
+    partitioning = ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITIONS]), flavor="hive")
+    dataset = ds.dataset(snapshot_path(table, db_name), format="parquet", partitioning=partitioning,
+                         exclude_invalid_files=True)
+    # Partition filters decide which files are opened at all
+    condition = None
+    for expression in [
+        ds.field("country") == country if country is not None else None,
+        ds.field("brand") == brand if brand is not None else None,
+        ds.field("month") >= start[:7] if start is not None else None,
+        ds.field("month") <= end[:7] if end is not None else None,
+        ds.field(spec.date) >= start if start is not None else None,
+        ds.field(spec.date) < end if end is not None else None,
+    ]:
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+    # Little readahead: memory stays at a few batches however many partitions match
+    for batch in dataset.to_batches(filter=condition, batch_size=chunk_rows, batch_readahead=1, fragment_readahead=1):
+        frame = batch.to_pandas()
+        frame = frame.rename(columns={"country": spec.country, "brand": spec.brand})
+        yield frame[spec.columns]
+
+
+def iter_range(table, db_name=DB_NAME, country=None, brand=None, start=None, end=None, chunk_rows=CHUNK_ROWS):
+    """Yields the rows of read_range as DataFrames of at most chunk_rows rows."""
+    spec = TABLES[table]
+    manifest = load_manifest(table, db_name) if available() else None
+    if manifest is None:
+        yield from _iter_sqlite(spec, db_name, country, brand, start, end, chunk_rows)
+        return
+
+    cutoff = manifest["cutoff"]
+    if start is None or start < cutoff:
+        yield from _iter_snapshot(table, spec, db_name, country, brand, start,
+                                  cutoff if end is None else min(end, cutoff), chunk_rows)
+    if end is None or end > cutoff:
+        yield from _iter_sqlite(spec, db_name, country, brand, cutoff if start is None else max(start, cutoff), end,
+                                chunk_rows)
+
+
+def read_range(table, db_name=DB_NAME, country=None, brand=None, start=None, end=None):
+    """Rows of table ("status" or "prices") for a country, brand and [start, end) date range.
+
+    Dates are "YYYY-MM-DD[ HH:MM:SS]" strings; None means no limit. Returns the
+    columns of TABLES[table].columns, in no particular order.
+    """
+    frames = [frame for frame in iter_range(table, db_name, country, brand, start, end) if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=TABLES[table].columns)
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--table", choices=list(TABLES), help="only export this table")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    migrate(args.db)
+    for table in [args.table] if args.table else list(TABLES):
+        manifest = export_table(table, args.db)
+        print(f"{table}: {manifest['rows']:,} rows before {manifest['cutoff']} in "
+              f"{manifest['partitions']} partitions ({manifest['seconds']}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,3 @@
 call "sharkninjadev\Scripts\activate"
+start "Sharkninja worker" python worker.py
 streamlit run streamlit_app.py
\ No newline at end of file
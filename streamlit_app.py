@@ -1,56 +1,33 @@
 import streamlit as st
 from time import sleep
 from navigation import make_sidebar
-import sqlite3
+from schema import migrate
+from db import reader, writer
 from datetime import datetime
 
 def check_credentials(username, password):
-    conn = sqlite3.connect('Sharkninja.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM swaggers WHERE username = ? AND password = ?", (username, password))
-    result = cursor.fetchone()
+    with reader() as conn:
+        result = conn.execute("SELECT * FROM swaggers WHERE username = ? AND password = ?", (username, password)).fetchone()
     
     # Log the login attempt
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     success = result is not None
-    cursor.execute("INSERT INTO login_logs (username, timestamp, success) VALUES (?, ?, ?)", (username, timestamp, success))
-    conn.commit()
+    with writer() as conn:
+        conn.execute("INSERT INTO login_logs (username, timestamp, success) VALUES (?, ?, ?)", (username, timestamp, success))
     
-    conn.close()
     return success
 
 def username_exists(username):
-    conn = sqlite3.connect('Sharkninja.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM swaggers WHERE username = ?", (username,))
-    result = cursor.fetchone()
-    conn.close()
+    with reader() as conn:
+        result = conn.execute("SELECT * FROM swaggers WHERE username = ?", (username,)).fetchone()
     return result is not None
 
 def create_user(username, password):
-    conn = sqlite3.connect('Sharkninja.db')
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO swaggers (username, password) VALUES (?, ?)", (username, password))
-    conn.commit()
-    conn.close()
+    with writer() as conn:
+        conn.execute("INSERT INTO swaggers (username, password) VALUES (?, ?)", (username, password))
 
-# Add this function to create the login_logs table if it doesn't exist
-def create_login_logs_table():
-    conn = sqlite3.connect('Sharkninja.db')
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS login_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL,
-        timestamp TEXT NOT NULL,
-        success BOOLEAN NOT NULL
-    )
-    """)
-    conn.commit()
-    conn.close()
-
-# Call this function at the beginning of your script
-create_login_logs_table()
+# Create missing tables and indexes, including login_logs
+migrate()
 
 make_sidebar()
 
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The modules live in the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import close_all  # noqa: E402
+from schema import migrate  # noqa: E402
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    """A freshly migrated database; its pooled connections are closed afterwards."""
+    db_name = str(tmp_path / "test.db")
+    migrate(db_name)
+    yield db_name
+    close_all()
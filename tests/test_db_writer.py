@@ -0,0 +1,83 @@
+"""Change-only status writes and price diffing."""
+import sqlite3
+
+from db_writer import STANDALONE, changed_statuses, save_prices, save_products
+
+
+def row(date, status="IN", price="€ 199,99", sku="AF300EU", country="NL"):
+    return (sku, "Ninja Foodi", date, f"https://www.ninjakitchen.nl/product/zid{sku}", status, "Ninja", price,
+            country, "Ninja")
+
+
+def query(db_name, sql):
+    conn = sqlite3.connect(db_name)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_changed_statuses_keeps_only_changes_in_date_order():
+    statuses = [
+        (1, 1, 1, "2026-01-01 12:00:00", "OUT", "Ninja", "10"),
+        (1, 1, 1, "2026-01-01 10:00:00", "IN", "Ninja", "10"),
+        (1, 1, 1, "2026-01-01 11:00:00", "IN", "Ninja", "10"),
+        (2, 1, 1, "2026-01-01 10:00:00", "IN", "Ninja", "20"),
+    ]
+    last_seen = {(2, 1): ("2026-01-01 09:00:00", "IN", "20")}
+    assert changed_statuses(statuses, last_seen) == [statuses[1], statuses[0]]
+    assert last_seen[1, 1] == ("2026-01-01 12:00:00", "OUT", "10")
+    assert last_seen[2, 1] == ("2026-01-01 10:00:00", "IN", "20")
+
+
+def test_save_products_writes_status_only_when_it_changes(db_name):
+    assert save_products([row("2026-01-01 10:00:00")], db_name) == 1
+    assert save_products([row("2026-01-01 11:00:00")], db_name) == 1
+    assert save_products([row("2026-01-01 12:00:00", "OUT")], db_name) == 1
+    assert save_products([row("2026-01-01 13:00:00", "OUT", "€ 149,99")], db_name) == 1
+
+    assert query(db_name, "SELECT Date, Status, CurrentPrice FROM ProductStatus ORDER BY Date") == [
+        ("2026-01-01 10:00:00", "IN", "€ 199,99"),
+        ("2026-01-01 12:00:00", "OUT", "€ 199,99"),
+        ("2026-01-01 13:00:00", "OUT", "€ 149,99"),
+    ]
+    assert query(db_name, "SELECT LastSeen, Status FROM ProductLastSeen") == [("2026-01-01 13:00:00", "OUT")]
+    assert query(db_name, "SELECT OutSince, BackInAt FROM StockEpisodes") == [("2026-01-01 12:00:00", None)]
+
+
+def test_save_products_records_rows_without_country(db_name):
+    assert save_products([row("2026-01-01 10:00:00", country=None)], db_name) == 0
+    assert query(db_name, "SELECT SKU, ErrorMessage FROM FailedInserts") == [
+        ("AF300EU", "Missing SKU, country or brand")]
+
+
+def test_save_prices_writes_first_and_changed_prices(db_name):
+    assert save_prices([row("2026-01-01 10:00:00")], db_name) == {
+        "first": 1, "changed": 0, "unchanged": 0, "skipped": 0, "collisions": 0}
+    assert save_prices([row("2026-01-01 11:00:00")], db_name)["unchanged"] == 1
+    assert save_prices([row("2026-01-01 12:00:00", price="€ 1.149,00")], db_name)["changed"] == 1
+    assert save_prices([row("2026-01-01 13:00:00", price="")], db_name)["skipped"] == 1
+
+    assert query(db_name, "SELECT Price, EntryDate, Reason FROM Prices ORDER BY EntryDate, Price") == [
+        (199.99, "2026-01-01 10:00:00", "First recorded price"),
+        (199.99, "2026-01-01 11:00:00", "Last known price"),
+        (1149.0, "2026-01-01 12:00:00", "Newly scraped price"),
+    ]
+
+
+def test_save_prices_standalone_history(db_name):
+    save_prices([row("2026-01-02 10:00:00")], db_name, STANDALONE)
+    save_prices([row("2026-01-03 10:00:00", price="€ 179,99")], db_name, STANDALONE)
+
+    assert query(db_name, "SELECT Price, EntryDate, Reason FROM Prices ORDER BY EntryDate") == [
+        (199.99, "2026-01-02", "Last recorded price"),
+        (199.99, "2026-01-02 10:00:00", "First recorded price"),
+        (179.99, "2026-01-03 10:00:00", "New scraped price"),
+    ]
+
+
+def test_save_prices_counts_collisions(db_name):
+    save_prices([row("2026-01-01 10:00:00")], db_name)
+    summary = save_prices([row("2026-01-01 10:00:00", price="€ 99,00")], db_name)
+    assert summary["changed"] == 1
+    assert summary["collisions"] == 1
@@ -0,0 +1,42 @@
+"""Out-of-stock episodes: the ordered pass and the StockEpisodes table against the old self-join query."""
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from benchmarks.bench_episodes import LEGACY_OUT_OF_STOCK_HISTORY, make_history, read_history
+from episodes import episodes_from_log, stock_episodes
+from queries import OUT_OF_STOCK_HISTORY
+
+
+def test_stock_episodes():
+    history = pd.DataFrame([
+        ("A", "2026-01-01 10:00:00", "OUT"),
+        ("A", "2026-01-01 12:00:00", "OUT"),
+        ("A", "2026-01-03 10:00:00", "IN"),
+        ("A", "2026-01-04 10:00:00", "OUT"),
+        ("B", "2026-01-01 10:00:00", "IN"),
+        ("B", "2026-01-02 10:00:00", "OUT"),
+        ("B", "2026-01-02 11:00:00", "IN"),
+    ], columns=["SKU", "DateTime", "Status"])
+    episodes = stock_episodes(history, now=datetime(2026, 1, 10, 12))
+    expected = pd.DataFrame([
+        ("A", "2026-01-04 10:00:00", None, 6),
+        ("A", "2026-01-01 10:00:00", "2026-01-03 10:00:00", 2),
+        ("B", "2026-01-02 10:00:00", "2026-01-02 11:00:00", 1),
+    ], columns=episodes.columns)
+    pd.testing.assert_frame_equal(episodes, expected, check_dtype=False)
+
+
+def test_stock_episodes_of_empty_history():
+    assert stock_episodes(pd.DataFrame(columns=["SKU", "DateTime", "Status"])).empty
+
+
+def test_episodes_match_legacy_query(db_name):
+    make_history(db_name, products=5, years=1, checks_per_day=2)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for country in ("NL", "BE"):
+        legacy = read_history(LEGACY_OUT_OF_STOCK_HISTORY, country, "Shark", db_name)
+        assert len(legacy)
+        pd.testing.assert_frame_equal(episodes_from_log(country, "Shark", db_name, now), legacy, check_dtype=False)
+        pd.testing.assert_frame_equal(read_history(OUT_OF_STOCK_HISTORY, country, "Shark", db_name), legacy,
+                                      check_dtype=False)
@@ -0,0 +1,92 @@
+"""The job queue and cron schedules."""
+from datetime import datetime
+
+import pytest
+
+import jobs
+from db import reader, writer
+
+
+def test_submit_merges_into_queued_job(db_name):
+    first = jobs.submit("sweep", {"due": True}, "NLShark", db_name=db_name)
+    assert jobs.submit("sweep", {"all": True}, "NLShark", priority=5, db_name=db_name) == first
+    assert jobs.submit("sweep", {"limit": 10}, "NLShark", db_name=db_name) == first
+    assert jobs.submit("sweep", None, "BEShark", db_name=db_name) != first
+
+    job = jobs.get_job(first, db_name)
+    assert job["Payload"] == {"due": True, "all": True, "limit": 10}
+    assert job["Priority"] == 5
+
+
+def test_claim_runs_one_job_per_group(db_name):
+    low = jobs.submit("sweep", None, "NLShark", db_name=db_name)
+    high = jobs.submit("snapshot", None, "NLShark", priority=1, db_name=db_name)
+    other = jobs.submit("sweep", None, "BEShark", db_name=db_name)
+
+    assert jobs.claim("a", db_name)["JobID"] == high
+    assert jobs.claim("b", db_name)["JobID"] == other
+    assert jobs.claim("c", db_name) is None
+
+    jobs.finish(high, {"checked": 3}, db_name)
+    job = jobs.claim("c", db_name)
+    assert (job["JobID"], job["Status"], job["Worker"]) == (low, jobs.RUNNING, "c")
+    assert jobs.get_job(high, db_name)["Result"] == {"checked": 3}
+
+
+def test_fail_retries_with_backoff_then_gives_up(db_name):
+    job_id = jobs.submit("sweep", None, "NLShark", db_name=db_name)
+    delays = []
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        assert jobs.claim("a", db_name)["Attempts"] == attempt
+        before = datetime.now().replace(microsecond=0)
+        jobs.fail(job_id, "boom", db_name)
+        job = jobs.get_job(job_id, db_name)
+        if job["Status"] == jobs.QUEUED:
+            delays.append((datetime.strptime(job["RunAfter"], jobs.DATE_FORMAT) - before).total_seconds())
+            # Make it runnable again without waiting
+            with writer(db_name) as conn:
+                conn.execute("UPDATE Jobs SET RunAfter = '2000-01-01 00:00:00' WHERE JobID = ?", (job_id,))
+
+    assert job["Status"] == jobs.FAILED
+    assert job["Error"] == "boom"
+    assert [round(delay / jobs.RETRY_DELAY) for delay in delays] == [1, 2]
+
+
+def test_requeue_does_not_count_the_attempt(db_name):
+    job_id = jobs.submit("sweep", None, "NLShark", db_name=db_name)
+    jobs.claim("a", db_name)
+    assert jobs.requeue([job_id], db_name) == 1
+    job = jobs.get_job(job_id, db_name)
+    assert (job["Status"], job["Worker"], job["Attempts"]) == (jobs.QUEUED, None, 0)
+    assert jobs.requeue([job_id], db_name) == 0
+
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("*/15 * * * *", datetime(2026, 3, 1, 10, 7), datetime(2026, 3, 1, 10, 15)),
+    ("*/15 * * * *", datetime(2026, 3, 1, 10, 15, 30), datetime(2026, 3, 1, 10, 30)),
+    ("0 2 * * *", datetime(2026, 3, 1, 10, 0), datetime(2026, 3, 2, 2, 0)),
+    ("30 8-9 * * 1-5", datetime(2026, 3, 6, 9, 45), datetime(2026, 3, 9, 8, 30)),    # Friday to Monday
+    ("0 0 1 * *", datetime(2026, 12, 15), datetime(2027, 1, 1)),
+    ("0 0 29 2 *", datetime(2026, 3, 1), None),      # no Feb 29 within a year
+    # Day and weekday both restricted: either matches, the 13th or a Friday
+    ("0 12 13 * 5", datetime(2026, 3, 1), datetime(2026, 3, 6, 12, 0)),
+    ("0 12 13 * 5", datetime(2026, 3, 10), datetime(2026, 3, 13, 12, 0)),
+    # */n doesn't restrict, so the weekday alone decides
+    ("0 12 */1 * 0", datetime(2026, 3, 2), datetime(2026, 3, 8, 12, 0)),
+])
+def test_cron_next(expression, after, expected):
+    if expected is None:
+        with pytest.raises(ValueError):
+            jobs.cron_next(expression, after)
+    else:
+        assert jobs.cron_next(expression, after) == expected
+
+
+def test_submit_due_schedules(db_name):
+    jobs.ensure_schedule("sweep NLShark", "sweep", "NLShark", "*/15 * * * *", db_name=db_name)
+    jobs.ensure_schedule("sweep NLShark", "sweep", "NLShark", "0 * * * *", db_name=db_name)
+    assert jobs.submit_due_schedules(db_name) == 1
+    assert jobs.submit_due_schedules(db_name) == 0
+    assert jobs.latest_job("sweep", "NLShark", db_name)["Status"] == jobs.QUEUED
+    with reader(db_name) as conn:
+        assert conn.execute("SELECT Cron FROM JobSchedules").fetchall() == [("*/15 * * * *",)]
@@ -0,0 +1,63 @@
+"""Unchanged pages are carried forward from the page cache instead of being parsed again."""
+import pytest
+
+from benchmarks.replay_server import ReplayServer
+from fetcher import check_availability_many
+from page_cache import PageCache
+
+
+@pytest.fixture(params=[True, False], ids=["etags", "no-etags"])
+def server(request):
+    server = ReplayServer(etags=request.param).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def without_date(record):
+    return record[:2] + record[3:]
+
+
+def test_second_sweep_carries_records_forward(db_name, server):
+    urls = server.product_urls(6)
+    cache = PageCache(db_name)
+    first = check_availability_many(urls, page_cache=cache)
+    assert all(first)
+    assert [record[0] for record in first] == [url.rsplit("zid", 1)[1] for url in urls]
+    assert (cache.parsed, cache.skipped) == (6, 0)
+
+    # A new cache, like the next run, reads what the first one saved
+    cache = PageCache(db_name)
+    second = check_availability_many(urls, page_cache=cache)
+    assert [without_date(record) for record in second] == [without_date(record) for record in first]
+    assert cache.parsed == 0
+    if server.etags:
+        assert (cache.not_modified, cache.same_hash) == (6, 0)
+    else:
+        assert (cache.not_modified, cache.same_hash) == (0, 6)
+
+
+def test_changed_page_is_parsed_again(db_name, server):
+    urls = server.product_urls(2)
+    check_availability_many(urls, page_cache=PageCache(db_name))
+    sku = urls[0].rsplit("zid", 1)[1]
+    server.pages[sku] = server.pages[sku].replace(b"</body>", b"<!-- changed --></body>")
+
+    cache = PageCache(db_name)
+    assert all(check_availability_many(urls, page_cache=cache))
+    assert (cache.parsed, cache.skipped) == (1, 1)
+
+
+def test_conditional_headers(db_name):
+    cache = PageCache(db_name)
+    assert cache.conditional_headers("https://www.sharkclean.nl/zidA") == {}
+    cache.update("https://www.sharkclean.nl/zidA", '"abc"', "Sun, 01 Mar 2026 12:00:00 GMT", "hash",
+                 ("A", "Shark", "2026-03-01 12:00:00", "url", "IN", "Shark", "€ 99,99"))
+    cache.save()
+
+    cache = PageCache(db_name)
+    cache.load(["https://www.sharkclean.nl/zidA"])
+    assert cache.conditional_headers("https://www.sharkclean.nl/zidA") == {
+        "If-None-Match": '"abc"', "If-Modified-Since": "Sun, 01 Mar 2026 12:00:00 GMT"}
+    assert cache.previous_record("https://www.sharkclean.nl/zidA", 200, "other") is None
+    assert cache.previous_record("https://www.sharkclean.nl/zidA", 200, "hash")[4:] == ("IN", "Shark", "€ 99,99")
@@ -0,0 +1,28 @@
+"""The streaming parser backends against BeautifulSoup on the saved product pages."""
+import pytest
+
+from benchmarks.replay_server import load_corpus
+from product_parser import available_backends, extract_fields, extract_product
+
+CORPUS = load_corpus()
+
+
+@pytest.mark.parametrize("backend", available_backends())
+@pytest.mark.parametrize("sku", list(CORPUS))
+def test_backend_matches_bs4(backend, sku):
+    html = CORPUS[sku].decode("utf-8")
+    fields = extract_fields(html, backend)
+    assert fields == extract_fields(html, "bs4")
+    assert fields.name
+
+
+def test_extract_product():
+    html = CORPUS["AF300EU"].decode("utf-8")
+    name, price, out_of_stock = extract_fields(html, "bs4")
+    sku, product_name, _, url, status, _, current_price = extract_product(
+        html, "https://www.ninjakitchen.nl/product/ninja-foodi-zidAF300EU?variant=1")
+    assert (sku, product_name, status, current_price) == ("AF300EU", name, "OUT" if out_of_stock else "IN", price)
+
+
+def test_page_without_title():
+    assert extract_product("<html><body><p>Not found</p></body></html>", "https://www.sharkclean.nl/zidX") is None
@@ -0,0 +1,31 @@
+"""The plan checks of schema.py (python schema.py --check-plans) on a freshly migrated database."""
+import sqlite3
+
+import pytest
+
+from db import close_all
+from schema import BATCH_PLAN_CHECKS, PLAN_CHECKS, full_scans, migrate
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    db_name = str(tmp_path_factory.mktemp("plans") / "plans.db")
+    migrate(db_name)
+    close_all()
+    conn = sqlite3.connect(db_name)
+    # db_writer fills this per batch
+    conn.execute("CREATE TEMP TABLE BatchKeys (ProductID INTEGER, CountryID INTEGER)")
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("name, query, params, aliases", PLAN_CHECKS + BATCH_PLAN_CHECKS,
+                         ids=[check[0] for check in PLAN_CHECKS + BATCH_PLAN_CHECKS])
+def test_query_uses_index(conn, name, query, params, aliases):
+    assert full_scans(conn, query, params, aliases) == []
+
+
+def test_covering_index_scan_is_a_full_scan(conn):
+    # Every row of Prices is read, even though it is through an index
+    scans = full_scans(conn, "SELECT p.ProductID, p.CountryID, p.EntryDate FROM Prices p", (), {"p"})
+    assert scans and "INDEX" in scans[0]
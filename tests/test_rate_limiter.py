@@ -0,0 +1,77 @@
+"""The AIMD token bucket and retry backoff."""
+import pytest
+
+import rate_limiter
+from rate_limiter import HostRateLimiter, TokenBucket, backoff_delay
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_spends_its_burst_then_waits(clock):
+    bucket = TokenBucket(rate=10, burst=4)
+    assert [bucket.take() for _ in range(4)] == [0.0] * 4
+    assert bucket.take() == pytest.approx(0.1)
+    clock.now += 0.1
+    assert bucket.take() == 0.0
+    # A quiet host saves up no more than the burst
+    clock.now += 60
+    assert [bucket.take() for _ in range(5)][-1] > 0
+
+
+def test_rate_increases_additively(clock):
+    bucket = TokenBucket()
+    for _ in range(4):
+        bucket.success()
+    assert bucket.rate == rate_limiter.INITIAL_RATE + 4 * rate_limiter.INCREASE
+    for _ in range(1000):
+        bucket.success()
+    assert bucket.rate == rate_limiter.MAX_RATE
+
+
+def test_rate_decreases_once_per_interval(clock):
+    bucket = TokenBucket(rate=20)
+    bucket.failure()
+    bucket.failure()
+    assert bucket.rate == 10
+    assert bucket.tokens <= 1
+    clock.now += rate_limiter.DECREASE_INTERVAL
+    bucket.failure()
+    assert bucket.rate == 5
+    for _ in range(20):
+        clock.now += rate_limiter.DECREASE_INTERVAL
+        bucket.failure()
+    assert bucket.rate == rate_limiter.MIN_RATE
+    assert bucket.failures == 23
+
+
+def test_host_limiter_keeps_hosts_apart(clock):
+    limiter = HostRateLimiter()
+    limiter.failure("a.example")
+    limiter.success("b.example")
+    limiter.set_rates({"c.example": 1000})
+    stats = limiter.stats()
+    assert stats["a.example"]["rate"] == rate_limiter.INITIAL_RATE * rate_limiter.DECREASE
+    assert stats["b.example"]["rate"] == rate_limiter.INITIAL_RATE + rate_limiter.INCREASE
+    assert stats["c.example"]["rate"] == rate_limiter.MAX_RATE
+
+
+def test_backoff_delay():
+    for attempt in range(10):
+        cap = min(rate_limiter.BACKOFF_MAX, rate_limiter.BACKOFF_BASE * 2 ** attempt)
+        assert cap / 2 <= backoff_delay(attempt) <= cap
+    assert backoff_delay(0, retry_after="30") == 30
+    assert backoff_delay(0, retry_after="3600") == rate_limiter.BACKOFF_MAX
+    assert backoff_delay(0, retry_after="Wed, 21 Oct 2026 07:28:00 GMT") <= rate_limiter.BACKOFF_BASE
@@ -0,0 +1,56 @@
+"""Per-URL check intervals."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from db import writer
+from scheduler import (FAILED_INTERVAL, MAX_INTERVAL, MIN_INTERVAL, OUT_INTERVAL, due_urls, next_interval,
+                       record_checks, seconds_until_next_due)
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.mark.parametrize("interval, changed, status, expected", [
+    (None, False, "IN", MIN_INTERVAL),
+    (3600, True, "IN", 1800),
+    (MIN_INTERVAL, True, "IN", MIN_INTERVAL),
+    (3600, False, "IN", 5400),
+    (MAX_INTERVAL, False, "IN", MAX_INTERVAL),
+    (3600, False, "OUT", OUT_INTERVAL),
+    (600, True, "OUT", MIN_INTERVAL),
+])
+def test_next_interval(interval, changed, status, expected):
+    assert next_interval(interval, changed, status) == expected
+
+
+def record(status, price="€ 99,99"):
+    return ("SKU", "Name", "2026-03-01 12:00:00", "url", status, "Shark", price)
+
+
+@pytest.fixture
+def urls(db_name):
+    urls = ["https://www.sharkclean.nl/zidA", "https://www.sharkclean.nl/zidB", "https://www.sharkclean.be/zidC"]
+    with writer(db_name) as conn:
+        conn.executemany("INSERT INTO urls (url, Country, Brand) VALUES (?, ?, 'Shark')",
+                         [(url, url.split(".")[2][:2].upper()) for url in urls])
+    return urls
+
+
+def test_record_checks(db_name, urls):
+    a, b, c = urls
+    assert sorted(due_urls(db_name, NOW)) == sorted(urls)
+    assert due_urls(db_name, NOW, group="BEShark") == [c]
+    assert seconds_until_next_due(db_name, NOW) == 0
+
+    assert record_checks({a: record("IN"), b: record("OUT"), c: None}, db_name, NOW) == 0
+    assert due_urls(db_name, NOW) == []
+    assert seconds_until_next_due(db_name, NOW) == MIN_INTERVAL
+    later = NOW + timedelta(seconds=max(MIN_INTERVAL, FAILED_INTERVAL))
+    # Out-of-stock products come first
+    assert due_urls(db_name, later)[0] == b
+
+    assert record_checks({a: record("IN"), b: record("IN"), c: record("IN")}, db_name, later) == 1
+    assert record_checks({a: record("IN", "€ 89,99")}, db_name, later + timedelta(hours=1)) == 1
+    with writer(db_name) as conn:
+        schedule = dict(conn.execute("SELECT URL, Interval FROM UrlSchedule").fetchall())
+    assert schedule == {a: MIN_INTERVAL, b: MIN_INTERVAL, c: MIN_INTERVAL}
@@ -0,0 +1,31 @@
+"""URL parsing: market and SKU."""
+import pytest
+
+from url_info import UrlInfo, extract_sku, market_groups, parse_url
+
+
+@pytest.mark.parametrize("url, sku", [
+    ("https://www.ninjakitchen.nl/product/ninja-foodi-zidAF300EU", "AF300EU"),
+    ("https://www.ninjakitchen.nl/product/ninja-foodi-zidAF300EU/", "AF300EU"),
+    ("https://www.ninjakitchen.nl/product/ninja-foodi-zidAF300EU?utm_source=mail&ref=zidX", "AF300EU"),
+    ("https://www.sharkclean.fr/product/aspirateur-zidIZ201EUT#reviews", "IZ201EUT"),
+    ("https://www.sharkclean.fr/product/zidane-edition-zidIZ400EU", "IZ400EU"),
+    ("https://www.sharkclean.fr/product/aspirateur", None),
+    ("https://www.sharkclean.fr/product/aspirateur-zid", None),
+])
+def test_extract_sku(url, sku):
+    assert parse_url(url).sku == sku
+
+
+def test_extract_sku_takes_a_path():
+    assert extract_sku("/product/ninja-zidBN750EU") == "BN750EU"
+
+
+def test_parse_url_market():
+    url = "https://sharkclean.be/product/zidHD334EU"
+    assert parse_url(url) == UrlInfo(url, "sharkclean.be", "BE", "Shark", "HD334EU")
+    assert parse_url("https://example.com/zidHD334EU")[2:4] == (None, None)
+
+
+def test_market_groups():
+    assert market_groups() == ["NLNinja", "NLShark", "BENinja", "BEShark", "FRNinja", "FRShark", "ESNinja", "ESShark"]
@@ -0,0 +1,170 @@
+"""Country, brand, host and SKU of a product URL, parsed once.
+
+    python url_info.py [--db Sharkninja.db]   # parse the urls rows that have no market yet
+
+MARKETS maps every shop host to the country and brand it sells; add a row to
+scrape a new market. parse_url() splits a URL into a UrlInfo record and keeps
+the result in memory, so the scrapers and save loops can ask for it as often as
+they like. The parsed columns are also stored in the urls table (see
+store_parsed), which lets the sweeps select a country/brand group with an
+indexed query instead of classifying every URL in Python.
+"""
+import argparse
+import logging
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from db import reader, writer
+from queries import ALL_GROUP_URLS, GROUP_URLS
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+CACHE_SIZE = 65536      # parsed URLs kept in memory
+SKU_MARKER = "zid"      # product paths end in "-zid<SKU>"
+
+# host (without "www."): (country, brand)
+MARKETS = {
+    "ninjakitchen.nl": ("NL", "Ninja"),
+    "sharkclean.nl": ("NL", "Shark"),
+    "ninjakitchen.be": ("BE", "Ninja"),
+    "sharkclean.be": ("BE", "Shark"),
+    "ninjakitchen.fr": ("FR", "Ninja"),
+    "sharkclean.fr": ("FR", "Shark"),
+    "ninjakitchen.es": ("ES", "Ninja"),
+    "sharkclean.es": ("ES", "Shark"),
+}
+
+# host is the URL's host name as fetched; country and brand are None for unknown hosts
+UrlInfo = namedtuple("UrlInfo", "url host country brand sku")
+
+
+def market(host):
+    """Returns (country, brand) for a host name, or (None, None)."""
+    host = (host or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return MARKETS.get(host, (None, None))
+
+
+def extract_sku(path):
+    """Returns the SKU at the end of a product path, or None.
+
+    Only the path is looked at, so query strings and fragments never end up in
+    the SKU. The last marker wins, in case a product slug contains "zid".
+    """
+    path = path.rstrip("/")
+    start = path.rfind(SKU_MARKER)
+    if start < 0:
+        return None
+    return path[start + len(SKU_MARKER):] or None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_url(url):
+    parts = urlsplit(url.strip())
+    host = parts.hostname
+    country, brand = market(host)
+    return UrlInfo(url, host, country, brand, extract_sku(parts.path))
+
+
+def categorize_url(url):
+    info = parse_url(url)
+    return info.country, info.brand
+
+
+def extract_id_from_url(url):
+    return parse_url(url).sku
+
+
+def group_key(country, brand):
+    return f"{country}{brand}"
+
+
+def market_groups():
+    """The country/brand group keys of every market, like "NLShark"."""
+    return [group_key(country, brand) for country, brand in dict.fromkeys(MARKETS.values())]
+
+
+def group_urls_by_category(urls):
+    """Groups URLs by country and brand: {"NLShark": [url, ...]}. URLs of unknown hosts are left out."""
+    grouped_urls = {}
+    for url in urls:
+        info = parse_url(url)
+        if info.country and info.brand:
+            grouped_urls.setdefault(group_key(info.country, info.brand), []).append(url)
+    return grouped_urls
+
+
+def _missing():
+    # Rows never parsed, and rows of a host that was added to MARKETS after they were
+    hosts = [prefix + host for host in MARKETS for prefix in ("", "www.")]
+    return f"(Host IS NULL OR (Country IS NULL AND Host IN ({', '.join('?' * len(hosts))})))", hosts
+
+
+def store_parsed(conn, only_missing=True):
+    """Fills the parsed columns of the urls table. Returns the number of rows updated.
+
+    By default only rows without a market are parsed: URLs added before the
+    columns existed or by a writer that only knows the url column, and URLs of
+    hosts that have been added to MARKETS since.
+    """
+    query, params = "SELECT url FROM urls WHERE url IS NOT NULL", []
+    if only_missing:
+        condition, params = _missing()
+        query += f" AND {condition}"
+    rows = []
+    for (url,) in conn.execute(query, params).fetchall():
+        info = parse_url(url)
+        rows.append((info.host, info.country, info.brand, info.sku, url))
+    conn.executemany("UPDATE urls SET Host = ?, Country = ?, Brand = ?, SKU = ? WHERE url = ?", rows)
+    return len(rows)
+
+
+def add_url(conn, url):
+    """Inserts a URL with its parsed columns; raises sqlite3.IntegrityError if it already exists."""
+    info = parse_url(url)
+    conn.execute("INSERT INTO urls (url, Host, Country, Brand, SKU) VALUES (?, ?, ?, ?, ?)",
+                 (url, info.host, info.country, info.brand, info.sku))
+    return info
+
+
+def refresh_urls(db_name=DB_NAME):
+    """Parses the urls rows that have no market yet; a no-op when there are none."""
+    condition, params = _missing()
+    with reader(db_name) as conn:
+        missing = conn.execute(f"SELECT COUNT(*) FROM urls WHERE url IS NOT NULL AND {condition}", params).fetchone()[0]
+    if not missing:
+        return 0
+    with writer(db_name) as conn:
+        updated = store_parsed(conn)
+    logger.info(f"Parsed {updated} URLs without a market")
+    return updated
+
+
+def fetch_grouped_urls(db_name=DB_NAME, group=None):
+    """Reads the URLs of every market, or of one group key, grouped like group_urls_by_category."""
+    query, params = ALL_GROUP_URLS, ()
+    if group is not None:
+        query, params = GROUP_URLS, (group[:2], group[2:])
+    grouped_urls = {}
+    with reader(db_name) as conn:
+        for country, brand, url in conn.execute(query, params):
+            grouped_urls.setdefault(group_key(country, brand), []).append(url)
+    return grouped_urls
+
+
+if __name__ == "__main__":
+    from schema import migrate
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_NAME)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    migrate(args.db)
+    print(f"Parsed {refresh_urls(args.db)} URLs")
+    for key, urls in fetch_grouped_urls(args.db).items():
+        print(f"{key}: {len(urls)} URLs")
@@ -0,0 +1,202 @@
+"""Worker daemon: runs stock sweeps from the job queue.
+
+    python worker.py --workers 3                  # run the daemon
+    python worker.py --submit NLShark [--all]     # queue a sweep for one group and exit
+
+Every country/brand group has a cron-like schedule in JobSchedules (every 15
+minutes by default; edit the Cron column to change it). A scheduled sweep checks
+the group's URLs that are due; an on-demand sweep from the dashboard or
+--submit --all checks all of them. Each worker thread takes one job at a time,
+so groups are swept in parallel, and a failing group is retried with backoff
+without holding up the others. SIGTERM or Ctrl+C stops the daemon: workers get
+STOP_SECONDS to finish their job, and jobs still running then are put back in
+the queue. When pyarrow is installed, the Parquet snapshots
+of the status and price history are refreshed every night (SNAPSHOT_CRON).
+"""
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+import jobs
+import metrics
+import snapshots
+from db import log_lock_stats
+from dimension_cache import get_cache
+from http_client import log_pool_stats
+from pipeline import shutdown_parse_pool
+from scheduledstart import check_stock
+from scheduler import due_urls
+from schema import migrate
+from url_info import fetch_grouped_urls, market_groups, refresh_urls
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DB_NAME = "Sharkninja.db"
+WORKERS = 3
+POLL_SECONDS = 5            # how often an idle worker looks for a job
+SCHEDULE_SECONDS = 30       # how often schedules and stale jobs are checked
+HEARTBEAT_SECONDS = 60
+STOP_SECONDS = 60           # how long a stopping daemon waits for jobs in progress
+GROUPS = market_groups()     # one per url_info.MARKETS country and brand
+DEFAULT_CRON = "*/15 * * * *"
+SNAPSHOT_CRON = "30 3 * * *"
+SNAPSHOT_GROUP = "snapshots"    # group key of snapshot jobs, so only one rewrites the snapshots at a time
+
+
+def setup_logging():
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LOGS")
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, f"worker_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(threadName)s - %(levelname)s - %(message)s",
+        handlers=[logging.FileHandler(log_file), logging.StreamHandler()],
+    )
+
+
+def run_sweep(job, db_name=DB_NAME):
+    """Checks one group's URLs: the due ones, or all of them when the payload says so."""
+    group = job["GroupKey"]
+    if job["Payload"].get("all"):
+        urls = fetch_grouped_urls(db_name, group).get(group, [])
+    else:
+        urls = due_urls(db_name, group=group)
+    logger.info(f"Sweeping {len(urls)} URLs for {group}")
+
+    last_report = 0.0
+
+    def progress(done, total):
+        nonlocal last_report
+        now = time.monotonic()
+        if done == total or now - last_report >= 1:
+            last_report = now
+            jobs.update_progress(job["JobID"], done, total, db_name)
+
+    jobs.update_progress(job["JobID"], 0, len(urls), db_name)
+    if not urls:
+        return {group: {"out": 0, "in": 0, "skipped": 0}}
+    return check_stock({group: urls}, progress, kind="worker", db_name=db_name)
+
+
+def run_snapshot(job, db_name=DB_NAME):
+    return snapshots.export_all(db_name)
+
+
+HANDLERS = {
+    "sweep": run_sweep,
+    "snapshot": run_snapshot,
+}
+
+
+class Worker(threading.Thread):
+    def __init__(self, name, stop, db_name=DB_NAME):
+        super().__init__(name=name, daemon=True)
+        self.stop = stop
+        self.db_name = db_name
+        self.job_id = None      # job in progress, for heartbeats
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                job = jobs.claim(self.name, self.db_name)
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self.stop.wait(POLL_SECONDS)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        job_id = job["JobID"]
+        logger.info(f"Starting {job['Kind']} job {job_id} for {job['GroupKey']} (attempt {job['Attempts']})")
+        self.job_id = job_id
+        start = time.perf_counter()
+        try:
+            result = HANDLERS[job["Kind"]](job, self.db_name)
+            jobs.finish(job_id, result, self.db_name)
+            logger.info(f"Finished job {job_id} in {time.perf_counter() - start:.0f}s")
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            jobs.fail(job_id, f"{type(e).__name__}: {e}", self.db_name)
+        finally:
+            self.job_id = None
+
+
+def ensure_default_schedules(db_name=DB_NAME):
+    for group in GROUPS:
+        jobs.ensure_schedule(f"sweep {group}", "sweep", group, DEFAULT_CRON, db_name=db_name)
+    if snapshots.available():
+        jobs.ensure_schedule("snapshot", "snapshot", SNAPSHOT_GROUP, SNAPSHOT_CRON, db_name=db_name)
+
+
+def run_daemon(workers=WORKERS, db_name=DB_NAME):
+    migrate(db_name)
+    refresh_urls(db_name)
+    ensure_default_schedules(db_name)
+
+    stop = threading.Event()
+    threads = [Worker(f"worker-{i + 1}", stop, db_name) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    logger.info(f"Started {workers} workers")
+
+    def request_stop(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, stopping workers after their current job...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    last_heartbeat = 0.0
+    try:
+        while not stop.is_set():
+            try:
+                jobs.submit_due_schedules(db_name)
+                jobs.requeue_stale(db_name)
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_SECONDS:
+                    jobs.heartbeat([t.job_id for t in threads if t.job_id is not None], db_name)
+                    last_heartbeat = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error in the scheduler loop: {e}")
+            stop.wait(SCHEDULE_SECONDS)
+
+        deadline = time.monotonic() + STOP_SECONDS
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Jobs that didn't finish in time go back to the queue instead of waiting for requeue_stale
+        jobs.requeue([t.job_id for t in threads if t.job_id is not None], db_name)
+    finally:
+        shutdown_parse_pool()
+        log_pool_stats(logger)
+        get_cache(db_name).log_stats(logger)
+        log_lock_stats(logger, db_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--submit", metavar="GROUP", choices=GROUPS, help="queue a sweep for GROUP and exit")
+    parser.add_argument("--all", action="store_true", help="with --submit: check every URL of the group")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    if args.submit:
+        migrate(DB_NAME)
+        job_id = jobs.submit("sweep", {"all": args.all}, args.submit, priority=1)
+        print(f"Queued job {job_id}")
+        return
+
+    setup_logging()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    run_daemon(args.workers)
+
+
+if __name__ == "__main__":
+    main()